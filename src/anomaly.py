@@ -0,0 +1,279 @@
+"""Online anomaly and change-point detection for station series.
+
+Each (metric, station) series keeps a small incremental state that is updated in
+O(1) per new sample:
+
+- Welford running mean/variance of the whole series, used to scale the CUSUM,
+- the running mean of the current regime, used as the CUSUM target,
+- an EWMA mean/variance, used to score outliers against the recent level,
+- two-sided CUSUM sums, which flag sustained shifts (change points),
+- the length of the current run of identical values, which flags stuck sensors.
+
+The state and the flags found so far are persisted as JSON, so a rerun only feeds
+the samples that are newer than the last processed month of each series. A series is
+rescanned from the start when any of its already processed months was revised (e.g.
+after regenerating the CSVs), and the whole state is discarded when the detector
+parameters or the metric configuration change.
+"""
+import hashlib
+import json
+import logging
+import math
+import os
+
+import pandas as pd
+
+STATE_VERSION = 2
+
+# Flags that mark bad data; change points are real level shifts and are kept
+EXCLUDED_FLAGS = {'outlier', 'flat', 'implausible'}
+
+METRIC_CONFIG = {
+    'db_a': {'plausible': (30.0, 110.0), 'flat_run': 3},
+    'patient_count': {'plausible': (0.0, None), 'flat_run': None},
+}
+
+DETECTOR_PARAMS = {
+    'warmup': 6,           # samples before outliers and change points are flagged
+    'z_threshold': 3.5,    # EWMA z-score for outliers
+    'ewma_alpha': 0.3,
+    'cusum_k': 0.5,        # CUSUM slack, in standard deviations
+    'cusum_h': 8.0,        # CUSUM decision threshold, in standard deviations
+    'min_std': 0.5,        # floor for the standard deviation of near-constant series
+}
+
+def get_default_state_path():
+    """Return cache/anomaly_state.json in the project root"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    return os.path.join(os.path.dirname(current_dir), 'cache', 'anomaly_state.json')
+
+class SeriesState:
+    """Incremental statistics for one station series"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.regime_n = 0
+        self.regime_mean = 0.0
+        self.ewma = None
+        self.ewvar = 0.0
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+        self.last_value = None
+        self.run_length = 0
+        self.last_date = None
+        # Hash of the series up to last_date, to notice revised months
+        self.fingerprint = None
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        state.__dict__.update(data)
+        return state
+
+    def std(self, params):
+        variance = self.m2 / (self.n - 1) if self.n > 1 else 0.0
+        return max(math.sqrt(variance), params['min_std'])
+
+    def reset_regime(self, value):
+        """Start a new regime at `value` after a change point"""
+        self.regime_n = 1
+        self.regime_mean = value
+        self.ewma = value
+        self.cusum_pos = 0.0
+        self.cusum_neg = 0.0
+
+    def update(self, value, config, params=DETECTOR_PARAMS):
+        """Feed one sample and return a list of (flag, score) pairs"""
+        flags = []
+
+        # Stuck sensors repeat exactly the same value
+        if self.last_value is not None and abs(value - self.last_value) < 1e-9:
+            self.run_length += 1
+        else:
+            self.run_length = 1
+        self.last_value = value
+        if config['flat_run'] and self.run_length >= config['flat_run']:
+            flags.append(('flat', float(self.run_length)))
+
+        low, high = config['plausible']
+        if (low is not None and value < low) or (high is not None and value > high):
+            # Implausible values never enter the statistics
+            flags.append(('implausible', value))
+            return flags
+
+        warm = self.n >= params['warmup']
+        is_outlier = False
+        if warm and self.ewma is not None:
+            # The EWMA variance is noisy on short series, so never score below the long-run spread
+            ew_std = max(math.sqrt(self.ewvar), self.std(params))
+            z = (value - self.ewma) / ew_std
+            if abs(z) > params['z_threshold']:
+                flags.append(('outlier', z))
+                is_outlier = True
+
+        # CUSUM against the regime mean, standardized by the long-run deviation
+        if self.regime_n > 0:
+            std = self.std(params)
+            deviation = (value - self.regime_mean) / std
+            self.cusum_pos = max(0.0, self.cusum_pos + deviation - params['cusum_k'])
+            self.cusum_neg = max(0.0, self.cusum_neg - deviation - params['cusum_k'])
+            if warm and self.regime_n >= params['warmup'] and max(self.cusum_pos, self.cusum_neg) > params['cusum_h']:
+                score = self.cusum_pos if self.cusum_pos >= self.cusum_neg else -self.cusum_neg
+                flags.append(('change_point', score))
+                self.reset_regime(value)
+                return flags
+
+        # The EWMA follows every plausible value so a sustained shift stops scoring as outliers
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            increment = params['ewma_alpha'] * diff
+            self.ewma += increment
+            self.ewvar = (1 - params['ewma_alpha']) * (self.ewvar + diff * increment)
+
+        # Outliers are kept out of the baseline so a single spike does not drag it
+        if not is_outlier:
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (value - self.mean)
+            self.regime_n += 1
+            self.regime_mean += (value - self.regime_mean) / self.regime_n
+        return flags
+
+def _as_json(value):
+    """`value` as it reads back from the state file (tuples become lists)"""
+    return json.loads(json.dumps(value))
+
+def _fingerprint(periods, values):
+    """Hash of a series' months and values"""
+    text = ';'.join(f'{period}={value!r}' for period, value in zip(periods, values))
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+class AnomalyDetector:
+    """Detector state for all station series, persisted between runs"""
+
+    def __init__(self, state_path=None):
+        self.state_path = state_path or get_default_state_path()
+        self.series = {}
+        self.flags = []
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return
+        try:
+            with open(self.state_path) as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable anomaly state {self.state_path}: {str(e)}")
+            return
+        if (data.get('version') != STATE_VERSION or data.get('params') != DETECTOR_PARAMS
+                or data.get('config') != _as_json(METRIC_CONFIG)):
+            logging.info("Anomaly detector parameters changed, rescanning history")
+            return
+        self.series = {key: SeriesState.from_dict(value) for key, value in data['series'].items()}
+        self.flags = data['flags']
+
+    def save(self):
+        data = {
+            'version': STATE_VERSION,
+            'params': DETECTOR_PARAMS,
+            'config': METRIC_CONFIG,
+            'series': {key: state.to_dict() for key, state in self.series.items()},
+            'flags': self.flags,
+        }
+        # Write atomically; several app workers may save at the same time
+        tmp_path = f'{self.state_path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            # The flags are still valid; the next run just rescans from the old state
+            logging.warning(f"Could not save anomaly state {self.state_path}: {str(e)}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def process(self, data, metric):
+        """Feed the samples of `metric` that are newer than each series' last processed month.
+
+        Returns the number of samples fed.
+        """
+        config = METRIC_CONFIG[metric]
+        monthly = data.groupby(['station_name', 'date'])[metric].mean().reset_index().sort_values('date')
+        fed = 0
+        for station, rows in monthly.groupby('station_name'):
+            key = f'{metric}|{station}'
+            periods = rows['date'].dt.strftime('%Y-%m').tolist()
+            values = rows[metric].tolist()
+            state = self.series.get(key)
+            if state is not None and state.last_date is not None:
+                processed = sum(period <= state.last_date for period in periods)
+                if _fingerprint(periods[:processed], values[:processed]) != state.fingerprint:
+                    logging.info(f"Revised data in {key}, rescanning the series")
+                    self.flags = [flag for flag in self.flags
+                                  if (flag['metric'], flag['station_name']) != (metric, station)]
+                    state = None
+            if state is None:
+                state = self.series[key] = SeriesState()
+            for period, value in zip(periods, values):
+                if (state.last_date is not None and period <= state.last_date) or pd.isna(value):
+                    continue
+                for flag, score in state.update(float(value), config):
+                    self.flags.append({
+                        'station_name': station,
+                        'period': period,
+                        'metric': metric,
+                        'value': float(value),
+                        'flag': flag,
+                        'score': round(float(score), 3),
+                    })
+                state.last_date = period
+                fed += 1
+            if state.last_date is not None:
+                processed = sum(period <= state.last_date for period in periods)
+                state.fingerprint = _fingerprint(periods[:processed], values[:processed])
+        return fed
+
+    def flags_frame(self):
+        flags = pd.DataFrame(self.flags, columns=['station_name', 'period', 'metric', 'value', 'flag', 'score'])
+        flags['date'] = pd.to_datetime(flags['period'], format='%Y-%m')
+        return flags
+
+def detect_anomalies(patients, noise_data, state_path=None):
+    """Update the persisted detector with new monthly samples and return all flags"""
+    detector = AnomalyDetector(state_path)
+    fed = detector.process(noise_data, 'db_a') + detector.process(patients, 'patient_count')
+    if fed:
+        detector.save()
+    logging.info(f"Anomaly detector processed {fed} new samples, {len(detector.flags)} flags in total")
+    return detector.flags_frame()
+
+def mark_flags(data, flags, metric):
+    """Add `flag` (comma-separated reasons or empty) and `flagged` columns for one metric"""
+    metric_flags = flags[flags['metric'] == metric]
+    reasons = metric_flags.groupby(['station_name', 'date'])['flag'].agg(lambda x: ', '.join(sorted(set(x))))
+    reasons = reasons.rename('flag').reset_index()
+    marked = data.drop(columns=['flag', 'flagged'], errors='ignore').merge(reasons, on=['station_name', 'date'], how='left')
+    marked['flag'] = marked['flag'].fillna('')
+    marked['flagged'] = marked['flag'] != ''
+    return marked
+
+def exclude_flagged(data, flags, metric):
+    """Drop rows of `metric` whose station month carries one of EXCLUDED_FLAGS"""
+    bad = flags[(flags['metric'] == metric) & flags['flag'].isin(EXCLUDED_FLAGS)]
+    bad_keys = set(zip(bad['station_name'], bad['date']))
+    if not bad_keys:
+        return data
+    keep = [key not in bad_keys for key in zip(data['station_name'], data['date'])]
+    return data[keep]
@@ -0,0 +1,437 @@
+"""Local read-only JSON/GeoJSON API over the Mainz station data.
+
+Serves the same data that `load_data` produces, without a Streamlit session:
+
+    GET /periods                             list of available periods (YYYY-MM)
+    GET /stations                            stations with coordinates
+    GET /period/<YYYY-MM>                    GeoJSON of station values for one month
+    GET /range?start=<YYYY-MM>&end=<YYYY-MM> GeoJSON of station aggregates over a range
+    GET /station/<name>                      monthly series of one station
+    GET /static/<path>                       map assets from src/static (see map_assets.py)
+
+All period and station responses are built once at startup, gzip-compressed and
+tagged with strong ETags, so a request is a dict lookup plus one socket write.
+Range responses are computed from the prefix-sum index on first use and kept
+in a small LRU cache. Static assets requested with a `?v=<hash>` version
+parameter are served with a one-year immutable Cache-Control header.
+
+Run locally with:
+    python src/data_api.py --port 8600
+    curl -i --compressed http://127.0.0.1:8600/period/2018-10
+"""
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import math
+import mimetypes
+import os
+from collections import OrderedDict
+from urllib.parse import unquote, urlsplit, parse_qs
+
+import pandas as pd
+
+from data_loader import station_coords, read_data
+from range_index import RangeIndex
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+MAX_HEADER_BYTES = 16 * 1024
+RANGE_CACHE_SIZE = 1024
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+STATUS_TEXT = {
+    200: 'OK',
+    304: 'Not Modified',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    431: 'Request Header Fields Too Large',
+}
+
+def _clean(value):
+    """Convert numpy/pandas scalars to JSON-safe Python values (NaN becomes null)"""
+    if value is None:
+        return None
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            return None
+    return value
+
+def _period_key(date):
+    return date.strftime('%Y-%m')
+
+class Response:
+    """A fully encoded response with identity and (optional) gzip variants"""
+
+    def __init__(self, body, content_type='application/json; charset=utf-8', status=200,
+                 cache_control='no-cache', compress=True):
+        self.status = status
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.body = body
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+        self.head = self._encode_head(self.body, self.etag, None)
+        self.not_modified = self._encode_not_modified(self.etag)
+        if compress:
+            self.gzip_body = gzip.compress(self.body, compresslevel=9, mtime=0)
+            # Strong ETags must differ between content codings of the same resource
+            self.gzip_etag = '"%s-gz"' % hashlib.sha1(self.gzip_body).hexdigest()
+            self.gzip_head = self._encode_head(self.gzip_body, self.gzip_etag, 'gzip')
+            self.gzip_not_modified = self._encode_not_modified(self.gzip_etag)
+        else:
+            self.gzip_body = None
+
+    @classmethod
+    def from_json(cls, payload, content_type='application/json'):
+        body = json.dumps(payload, separators=(',', ':'), allow_nan=False).encode('utf-8')
+        return cls(body, '%s; charset=utf-8' % content_type)
+
+    def _encode_head(self, body, etag, encoding):
+        lines = [
+            'HTTP/1.1 %d %s' % (self.status, STATUS_TEXT[self.status]),
+            'Content-Type: %s' % self.content_type,
+            'Content-Length: %d' % len(body),
+            'ETag: %s' % etag,
+            'Cache-Control: %s' % self.cache_control,
+            'Vary: Accept-Encoding',
+            'Access-Control-Allow-Origin: *',
+        ]
+        if encoding:
+            lines.append('Content-Encoding: %s' % encoding)
+        return ('\r\n'.join(lines) + '\r\n').encode('latin-1')
+
+    def _encode_not_modified(self, etag):
+        lines = [
+            'HTTP/1.1 304 Not Modified',
+            'ETag: %s' % etag,
+            'Cache-Control: %s' % self.cache_control,
+            'Vary: Accept-Encoding',
+        ]
+        return ('\r\n'.join(lines) + '\r\n').encode('latin-1')
+
+def _station_feature(name, properties):
+    lat, lon = station_coords[name]
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [lon, lat]},
+        'properties': dict(station_name=name, **properties),
+    }
+
+def build_period_payload(period, noise_month, patients_month, weather_month):
+    """GeoJSON FeatureCollection of station values for one month"""
+    db_a = noise_month.groupby('station_name')['db_a'].mean()
+    patient_count = patients_month.groupby('station_name')['patient_count'].sum()
+    stations = sorted(set(db_a.index) | set(patient_count.index))
+    features = [
+        _station_feature(name, {
+            'db_a': _clean(db_a.get(name)),
+            'patient_count': _clean(patient_count.get(name)),
+        })
+        for name in stations if name in station_coords
+    ]
+    mean_temp = weather_month['TT_10'].mean() if not weather_month.empty else None
+    return {
+        'type': 'FeatureCollection',
+        'period': period,
+        'mean_temperature': _clean(mean_temp),
+        'features': features,
+    }
+
+def build_range_payload(start, end, index):
+    """GeoJSON FeatureCollection of station aggregates between two months (inclusive)"""
+    station_totals = index.aggregate(start, end)
+    features = [
+        _station_feature(row.station_name, {
+            'db_a_mean': _clean(row.db_a),
+            'db_a_energy_mean': _clean(row.db_a_energy),
+            'db_a_months': _clean(row.noise_months),
+            'patient_total': int(row.patient_count) if row.patient_months else None,
+        })
+        for row in station_totals.itertuples()
+        if row.station_name in station_coords and (row.noise_months or row.patient_months)
+    ]
+    return {
+        'type': 'FeatureCollection',
+        'start': _period_key(start),
+        'end': _period_key(end),
+        'mean_temperature': _clean(index.mean_temperature(start, end)),
+        'features': features,
+    }
+
+def build_station_payload(name, noise_station, patients_station):
+    """Monthly db_a and patient count series for one station"""
+    db_a = noise_station.groupby('date')['db_a'].mean()
+    patient_count = patients_station.groupby('date')['patient_count'].sum()
+    dates = sorted(set(db_a.index) | set(patient_count.index))
+    lat, lon = station_coords[name]
+    return {
+        'station_name': name,
+        'latitude': lat,
+        'longitude': lon,
+        'series': [
+            {
+                'period': _period_key(date),
+                'db_a': _clean(db_a.get(date)),
+                'patient_count': _clean(patient_count.get(date)),
+            }
+            for date in dates
+        ],
+    }
+
+def parse_period(value):
+    """Parse a YYYY-MM string into a month Timestamp, or return None"""
+    if not value:
+        return None
+    try:
+        return pd.Timestamp(pd.to_datetime(value, format='%Y-%m'))
+    except (TypeError, ValueError):
+        return None
+
+class DataStore:
+    """Precomputed responses for every period and station"""
+
+    def __init__(self, weather, patients, noise_data):
+        self.weather = weather
+        self.patients = patients
+        self.noise_data = noise_data
+        self.responses = {}
+        self.index = RangeIndex(weather, patients, noise_data)
+        self.range_cache = OrderedDict()
+        self.static = {}
+        self._build()
+        self._load_static()
+
+    def _build(self):
+        noise_by_month = dict(tuple(self.noise_data.groupby('date')))
+        patients_by_month = dict(tuple(self.patients.groupby('date')))
+        weather_by_month = dict(tuple(self.weather.groupby('date')))
+        empty_noise = self.noise_data.iloc[0:0]
+        empty_patients = self.patients.iloc[0:0]
+        empty_weather = self.weather.iloc[0:0]
+
+        dates = sorted(set(noise_by_month) | set(patients_by_month))
+        periods = [_period_key(date) for date in dates]
+        for date, period in zip(dates, periods):
+            payload = build_period_payload(
+                period,
+                noise_by_month.get(date, empty_noise),
+                patients_by_month.get(date, empty_patients),
+                weather_by_month.get(date, empty_weather),
+            )
+            self.responses['/period/' + period] = Response.from_json(payload, 'application/geo+json')
+        self.responses['/periods'] = Response.from_json({'periods': periods})
+
+        noise_by_station = dict(tuple(self.noise_data.groupby('station_name')))
+        patients_by_station = dict(tuple(self.patients.groupby('station_name')))
+        stations = sorted(name for name in set(noise_by_station) | set(patients_by_station) if name in station_coords)
+        for name in stations:
+            payload = build_station_payload(
+                name,
+                noise_by_station.get(name, empty_noise),
+                patients_by_station.get(name, empty_patients),
+            )
+            self.responses['/station/' + name] = Response.from_json(payload)
+        self.responses['/stations'] = Response.from_json({
+            'stations': [
+                {'station_name': name, 'latitude': station_coords[name][0], 'longitude': station_coords[name][1]}
+                for name in stations
+            ]
+        })
+        logging.info(f"Precomputed {len(self.responses)} responses for {len(periods)} periods and {len(stations)} stations")
+
+    def _load_static(self, static_dir=STATIC_DIR):
+        """Read every file under the static directory into (revalidate, immutable) responses"""
+        for root, _, files in os.walk(static_dir):
+            for filename in files:
+                path = os.path.join(root, filename)
+                url = '/static/' + os.path.relpath(path, static_dir).replace(os.sep, '/')
+                content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+                compress = content_type.startswith(COMPRESSIBLE_TYPES)
+                if content_type.startswith('text/') or content_type == 'application/javascript':
+                    content_type += '; charset=utf-8'
+                with open(path, 'rb') as f:
+                    body = f.read()
+                self.static[url] = (
+                    Response(body, content_type, compress=compress),
+                    Response(body, content_type, cache_control=IMMUTABLE_CACHE, compress=compress),
+                )
+        logging.info(f"Serving {len(self.static)} static assets from {static_dir}")
+
+    def lookup_range(self, query):
+        params = parse_qs(query)
+        start = parse_period(params.get('start', [None])[0])
+        end = parse_period(params.get('end', [None])[0])
+        if start is None or end is None or end < start:
+            return None
+        key = (start, end)
+        response = self.range_cache.get(key)
+        if response is not None:
+            self.range_cache.move_to_end(key)
+            return response
+        payload = build_range_payload(start, end, self.index)
+        response = Response.from_json(payload, 'application/geo+json')
+        self.range_cache[key] = response
+        if len(self.range_cache) > RANGE_CACHE_SIZE:
+            self.range_cache.popitem(last=False)
+        return response
+
+    def lookup(self, target):
+        """Return (status, Response or None) for a request target"""
+        parts = urlsplit(target)
+        path = unquote(parts.path).rstrip('/') or '/'
+        if path == '/range':
+            response = self.lookup_range(parts.query)
+            return (200, response) if response is not None else (400, None)
+        if path.startswith('/static/'):
+            variants = self.static.get(path)
+            if variants is None:
+                return 404, None
+            # Versioned URLs change whenever the file does, so they can be cached forever
+            return 200, variants[1] if 'v' in parse_qs(parts.query) else variants[0]
+        response = self.responses.get(path)
+        return (200, response) if response is not None else (404, None)
+
+def _etag_matches(if_none_match, etag):
+    """If-None-Match uses weak comparison, so a W/ prefix is ignored"""
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def _accepts_gzip(accept_encoding):
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.strip().partition(';')
+        if name.strip().lower() in ('gzip', '*'):
+            return params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+def _error_bytes(status, keep_alive):
+    body = json.dumps({'error': STATUS_TEXT[status]}).encode('utf-8')
+    head = (
+        'HTTP/1.1 %d %s\r\nContent-Type: application/json; charset=utf-8\r\n'
+        'Content-Length: %d\r\n%s\r\n' % (
+            status, STATUS_TEXT[status], len(body), '' if keep_alive else 'Connection: close\r\n'
+        )
+    )
+    return head.encode('latin-1') + body
+
+class DataAPIProtocol(asyncio.Protocol):
+    """Minimal HTTP/1.1 server protocol with keep-alive and pipelining"""
+
+    def __init__(self, store):
+        self.store = store
+        self.transport = None
+        self.buffer = b''
+        # Offset up to which the buffer is known not to contain a complete header block
+        self.scanned = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        self.buffer += data
+        while self.transport is not None and not self.transport.is_closing():
+            end = self.buffer.find(b'\r\n\r\n', self.scanned)
+            if end < 0:
+                if len(self.buffer) > MAX_HEADER_BYTES:
+                    self._finish(_error_bytes(431, False), False)
+                    return
+                # The terminator may straddle the next chunk, so rescan the last 3 bytes
+                self.scanned = max(len(self.buffer) - 3, 0)
+                return
+            if end > MAX_HEADER_BYTES:
+                self._finish(_error_bytes(431, False), False)
+                return
+            head = self.buffer[:end].decode('latin-1')
+            self.buffer = self.buffer[end + 4:]
+            self.scanned = 0
+            lines = head.split('\r\n')
+            try:
+                method, target, version = lines[0].split(' ')
+            except ValueError:
+                self._finish(_error_bytes(400, False), False)
+                return
+            headers = {}
+            for line in lines[1:]:
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            # Only GET and HEAD are served and neither takes a body, so nothing past the
+            # headers is ever buffered: other methods are refused right away, and any body
+            # framing (chunked or a non-zero length) closes the connection, since the start
+            # of the next request could not be found reliably.
+            if method not in ('GET', 'HEAD'):
+                self._finish(_error_bytes(405, False), False)
+                return
+            content_length = headers.get('content-length', '0')
+            if 'transfer-encoding' in headers or not content_length.isdigit() or int(content_length):
+                self._finish(_error_bytes(400, False), False)
+                return
+
+            connection = headers.get('connection', '').lower()
+            keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+            self._finish(self._respond(method, target, headers, keep_alive), keep_alive)
+
+    def _respond(self, method, target, headers, keep_alive):
+        status, response = self.store.lookup(target)
+        if response is None:
+            return _error_bytes(status, keep_alive)
+
+        use_gzip = response.gzip_body is not None and _accepts_gzip(headers.get('accept-encoding', ''))
+        etag = response.gzip_etag if use_gzip else response.etag
+        connection = b'' if keep_alive else b'Connection: close\r\n'
+        if_none_match = headers.get('if-none-match')
+        if if_none_match and _etag_matches(if_none_match, etag):
+            not_modified = response.gzip_not_modified if use_gzip else response.not_modified
+            return not_modified + connection + b'\r\n'
+        head = response.gzip_head if use_gzip else response.head
+        if method == 'HEAD':
+            return head + connection + b'\r\n'
+        body = response.gzip_body if use_gzip else response.body
+        return head + connection + b'\r\n' + body
+
+    def _finish(self, data, keep_alive):
+        self.transport.write(data)
+        if not keep_alive:
+            self.transport.close()
+
+async def start_server(host, port, store):
+    """Start listening without blocking; port 0 picks a free port (see server.sockets)"""
+    loop = asyncio.get_running_loop()
+    return await loop.create_server(lambda: DataAPIProtocol(store), host, port)
+
+async def serve(host, port, store):
+    server = await start_server(host, port, store)
+    logging.info(f"Data API listening on http://{host}:{port}")
+    async with server:
+        await server.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve Mainz station data as JSON/GeoJSON')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind (default: localhost only)')
+    parser.add_argument('--port', type=int, default=8600)
+    args = parser.parse_args()
+
+    weather, patients, noise_data = read_data()
+    store = DataStore(weather, patients, noise_data)
+    try:
+        asyncio.run(serve(args.host, args.port, store))
+    except KeyboardInterrupt:
+        print("\nServer stopped.")
+
+if __name__ == '__main__':
+    main()
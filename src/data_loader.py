@@ -0,0 +1,161 @@
+import pandas as pd
+import glob
+import logging
+import os
+import re
+
+# Define station coordinates
+station_coords = {
+    'Ebersheim': (49.9275, 8.3458),
+    'Finthen': (49.9733, 8.1750),
+    'Gonsenheim': (49.9833, 8.2167),
+    'Hartenberg': (49.9833, 8.2667),
+    'Hechtsheim': (49.9667, 8.2500),
+    'Laubenheim': (49.9333, 8.3000),
+    'Lerchenberg': (49.9833, 8.2333),
+    'Marienborn': (49.9667, 8.2167),
+    'Mombach': (49.9833, 8.2167),
+    'Neustadt': (49.9833, 8.2667),
+    'Oberstadt': (49.9833, 8.2667),
+    'Weisenau': (49.9667, 8.2833),
+    'Bretzenheim': (49.9833, 8.2333)
+}
+
+def get_data_dir():
+    """Return the data directory in the project root (one level up from src)"""
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    project_root = os.path.dirname(current_dir)
+    return os.path.join(project_root, 'data')
+
+def get_base_station_name(filename):
+    """Extract base station name from filename, handling numbered stations"""
+    # Remove 'monthly_means_' prefix and '.csv' suffix
+    name = filename.replace('monthly_means_', '').replace('.csv', '')
+
+    # Extract base name and number if present
+    match = re.match(r'([A-Za-z]+)(?:_(\d+))?(?:_ooo)?', name)
+    if match:
+        base_name = match.group(1)
+        number = match.group(2)
+        return base_name, number
+    return name, None
+
+def read_data(data_dir=None):
+    """Load weather, patient and aircraft noise data without any Streamlit dependency.
+
+    Returns (weather, patients, noise_data). Errors are raised to the caller.
+    """
+    if data_dir is None:
+        data_dir = get_data_dir()
+
+    # Load weather data first
+    logging.info("Loading weather data...")
+    weather_path = os.path.join(data_dir, 'monthly_means_weather.csv')
+    weather = pd.read_csv(weather_path)
+    weather['date'] = pd.to_datetime(weather['month_year'], format='%B %Y')
+
+    # Load patient data
+    logging.info("Loading patient data...")
+    patients_path = os.path.join(data_dir, 'monthly_patients_by_station.csv')
+    patients = pd.read_csv(patients_path)
+    patients['date'] = pd.to_datetime(patients['month_year'], format='%B %Y')
+
+    # Extract station name from closest_station (remove 'Mainz/' prefix)
+    patients['station_name'] = patients['closest_station'].str.replace('Mainz/', '')
+
+    # Add coordinates to patient data
+    patients['latitude'] = patients['station_name'].map(lambda x: station_coords.get(x, [None, None])[0])
+    patients['longitude'] = patients['station_name'].map(lambda x: station_coords.get(x, [None, None])[1])
+
+    # Log the number of patient records with missing coordinates
+    missing_coords = patients[patients['latitude'].isna() | patients['longitude'].isna()]
+    if not missing_coords.empty:
+        logging.warning(f"Found {len(missing_coords)} patient records with missing coordinates")
+        logging.warning(f"Stations with missing coordinates: {missing_coords['station_name'].unique()}")
+
+    # Load aircraft noise data
+    logging.info("Loading aircraft noise data...")
+    noise_files = glob.glob(os.path.join(data_dir, 'monthly_means_*.csv'))
+    noise_files = [f for f in noise_files if 'weather' not in f]
+
+    # Create a dictionary to store DataFrames by base station name
+    station_data_dict = {}
+
+    for file in noise_files:
+        try:
+            df = pd.read_csv(file)
+            base_station, number = get_base_station_name(os.path.basename(file))
+
+            if base_station in station_coords:
+                df['station_name'] = base_station
+                df['station_number'] = number
+                df['date'] = pd.to_datetime(df['month_year'], format='%B %Y')
+                df['latitude'] = station_coords[base_station][0]
+                df['longitude'] = station_coords[base_station][1]
+
+                if base_station not in station_data_dict:
+                    station_data_dict[base_station] = []
+                station_data_dict[base_station].append(df)
+            else:
+                logging.warning(f"Skipping unknown station: {base_station}")
+        except Exception as e:
+            logging.error(f"Error processing file {file}: {str(e)}")
+            continue
+
+    # Combine data for stations with multiple measurements
+    noise_data = pd.DataFrame()
+    for base_station, dfs in station_data_dict.items():
+        if len(dfs) > 1:
+            # Multiple measurements exist, calculate mean
+            combined_df = pd.concat(dfs)
+            mean_df = combined_df.groupby(['month_year', 'date', 'station_name', 'latitude', 'longitude'])['db_a'].mean().reset_index()
+            noise_data = pd.concat([noise_data, mean_df], ignore_index=True)
+        else:
+            # Only one measurement exists, use it directly
+            noise_data = pd.concat([noise_data, dfs[0]], ignore_index=True)
+
+    return weather, patients, noise_data
+
+def filter_data_by_date(data, selected_date, frequency):
+    """Filter data based on selected date and frequency"""
+    if frequency == 'Monthly':
+        return data[
+            (data['date'].dt.year == selected_date.year) &
+            (data['date'].dt.month == selected_date.month)
+        ]
+    else:  # Annual
+        return data[data['date'].dt.year == selected_date.year]
+
+def filter_data_by_range(data, start_date, end_date):
+    """Filter data to the months between start_date and end_date (inclusive)"""
+    return data[(data['date'] >= start_date) & (data['date'] <= end_date)]
+
+def station_breakdown(patients, noise_data, weather, start_date, end_date, stations=None):
+    """Station-wise breakdown of patients, noise level and temperature for a period.
+
+    Returns one row per station with the total patient count, the mean dB level,
+    the number of months with noise data and the mean temperature of the period,
+    sorted by patient count like the breakdown table in the apps. Without `stations`
+    the rows are the stations with data in the period; requested stations are always
+    included, with zero counts and no dB level if they have no data.
+    """
+    period_patients = filter_data_by_range(patients, start_date, end_date)
+    period_noise = filter_data_by_range(noise_data, start_date, end_date)
+    period_weather = filter_data_by_range(weather, start_date, end_date)
+
+    patient_totals = period_patients.groupby('station_name')['patient_count'].sum()
+    noise_levels = period_noise.groupby('station_name')['db_a']
+    breakdown = pd.DataFrame({
+        'patient_count': patient_totals,
+        'db_a': noise_levels.mean(),
+        'noise_months': noise_levels.count(),
+    })
+    if stations is not None:
+        breakdown = breakdown.reindex(list(dict.fromkeys(stations)))
+
+    # Stations without patients or noise data in the period get zero counts
+    breakdown = breakdown.fillna({'patient_count': 0, 'noise_months': 0})
+    breakdown = breakdown.astype({'patient_count': int, 'noise_months': int})
+    breakdown['mean_temperature'] = period_weather['TT_10'].mean()
+    breakdown = breakdown.sort_values('patient_count', ascending=False)
+    return breakdown.rename_axis('station_name').reset_index()
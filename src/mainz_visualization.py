@@ -2,7 +2,6 @@ import streamlit as st
 import pandas as pd
 import folium
 from folium import plugins
-from streamlit_folium import folium_static
 import glob
 import logging
 from datetime import datetime
@@ -11,6 +10,9 @@ import os
 import re
 from folium.plugins import HeatMap
 from folium import CircleMarker, FeatureGroup
+from range_index import RangeIndex
+from anomaly import detect_anomalies, mark_flags, exclude_flagged
+from map_assets import map_payload, show_map
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -69,23 +71,68 @@ def load_data():
 
     return weather, patients, noise_data
 
+# Update the anomaly detector with any new months and return all flagged points
+@st.cache_data
+def load_flags():
+    weather, patients, noise_data = load_data()
+    return detect_anomalies(patients, noise_data)
+
+# Build the prefix-sum index once per process for the date range view
+@st.cache_resource
+def load_index(exclude_flagged_points=False):
+    weather, patients, noise_data = load_data()
+    if exclude_flagged_points:
+        flags = load_flags()
+        patients = exclude_flagged(patients, flags, 'patient_count')
+        noise_data = exclude_flagged(noise_data, flags, 'db_a')
+    return RangeIndex(weather, patients, noise_data)
+
 weather, patients, noise_data = load_data()
 
 st.title('Spatio-Temporal Visualization of Aircraft Noise and Patients')
 
-# Convert dates to datetime objects for the slider
-all_dates = sorted(patients['date'].unique())
-date_options = [d.strftime('%Y-%m-%d') for d in all_dates]
-selected_date_str = st.select_slider(
-    "Select Date",
-    options=date_options,
-    value=date_options[0]
-)
-selected_date = pd.to_datetime(selected_date_str)
+# Anomaly flags from the incremental detector
+exclude_flagged_points = st.checkbox("Exclude flagged points", value=False,
+                                     help="Drop outliers, flat and implausible readings before aggregating")
+flags = load_flags()
+if exclude_flagged_points:
+    patients = exclude_flagged(patients, flags, 'patient_count')
+    noise_data = exclude_flagged(noise_data, flags, 'db_a')
+patients = mark_flags(patients, flags, 'patient_count')
+noise_data = mark_flags(noise_data, flags, 'db_a')
+index = load_index(exclude_flagged_points)
+
+view = st.radio("View", ['Single Month', 'Date Range'], horizontal=True)
+lightweight = st.checkbox("Lightweight map", value=False,
+                          help="Load map libraries once from the self-hosted asset server")
+
+if view == 'Single Month':
+    # Convert dates to datetime objects for the slider
+    all_dates = sorted(patients['date'].unique())
+    date_options = [d.strftime('%Y-%m-%d') for d in all_dates]
+    selected_date_str = st.select_slider(
+        "Select Date",
+        options=date_options,
+        value=date_options[0]
+    )
+    selected_date = pd.to_datetime(selected_date_str)
+
+    # Filtered data
+    filtered_patients = patients[patients['date'] == selected_date].dropna(subset=['latitude', 'longitude'])
+    filtered_noise = noise_data[noise_data['date'] == selected_date].dropna(subset=['latitude', 'longitude'])
+else:
+    # Range slider over the months present in the data
+    start_date, end_date = st.select_slider(
+        "Select Date Range",
+        options=list(index.months),
+        value=(index.months[0], index.months[-1]),
+        format_func=lambda d: d.strftime('%b %Y')
+    )
 
-# Filtered data
-filtered_patients = patients[patients['date'] == selected_date].dropna(subset=['latitude', 'longitude'])
-filtered_noise = noise_data[noise_data['date'] == selected_date].dropna(subset=['latitude', 'longitude'])
+    # Total patients and mean noise per station over the range
+    station_totals = index.aggregate(start_date, end_date).dropna(subset=['latitude', 'longitude'])
+    filtered_patients = station_totals.dropna(subset=['patient_count'])
+    filtered_noise = station_totals.dropna(subset=['db_a'])
 
 # Normalize values for color intensities
 def normalize(series):
@@ -93,63 +140,106 @@ def normalize(series):
 
 filtered_noise['intensity'] = normalize(filtered_noise['db_a'])
 
-# Create map
-m = folium.Map(location=[49.9929, 8.2473], zoom_start=11)
-
-# Create feature groups for each layer
-noise_group = FeatureGroup(name='Aircraft Noise', show=True)
-patient_group = FeatureGroup(name='Patients', show=True)
-
-# Add noise layer (red heatmap)
-heat_noise = [[row['latitude'], row['longitude'], row['intensity']] for _, row in filtered_noise.iterrows()]
-HeatMap(heat_noise, 
-        name='Aircraft Noise',
-        gradient={0.4: 'yellow', 0.65: 'orange', 0.85: 'red', 1: 'darkred'},
-        radius=15,
-        blur=10,
-        max_zoom=1).add_to(noise_group)
-
 # Calculate the maximum number of patients for scaling
 max_patients = filtered_patients['patient_count'].max()
 
-# Add patient markers (concentric circles)
-for _, row in filtered_patients.iterrows():
+def patient_circles(row):
+    """Three concentric circles for one station, the radius scaled by its patient count"""
     num_patients = row['patient_count']
-    
-    # Calculate radius based on number of patients
     radius = 8 + (num_patients / max_patients) * 20
-    
-    # Create a cluster of circles
-    for i in range(3):  # Three concentric circles
-        current_radius = radius * (1 - i * 0.2)  # Decrease radius for inner circles
-        CircleMarker(
+
+    # Flagged counts are drawn in orange
+    flagged = row.get('flagged', False)
+    popup = f"{row['station_name']}: {num_patients} patients" + (f" (flagged: {row['flag']})" if flagged else "")
+    return [{
+        'lat': row['latitude'],
+        'lon': row['longitude'],
+        'radius': radius * (1 - i * 0.2),  # Decrease radius for inner circles
+        'popup': popup,
+        'color': 'orange' if flagged else '#1f77b4',  # A distinct blue color unless flagged
+        'fill_color': '#1f77b4',
+        'fill_opacity': 0.2,  # Very transparent
+        'weight': 2,  # Thicker border
+        'opacity': 0.8,  # More visible border
+    } for i in range(3)]
+
+heat_noise = [[row['latitude'], row['longitude'], row['intensity']] for _, row in filtered_noise.iterrows()]
+heat_gradient = {0.4: 'yellow', 0.65: 'orange', 0.85: 'red', 1: 'darkred'}
+flagged_noise = filtered_noise[filtered_noise['flagged']].drop_duplicates('station_name') if 'flagged' in filtered_noise else filtered_noise.iloc[0:0]
+circles = [circle for _, row in filtered_patients.iterrows() for circle in patient_circles(row)]
+
+if lightweight:
+    # Only the data is sent; Leaflet and the renderer come from the cached assets
+    m = map_payload([
+        {
+            'name': 'Aircraft Noise',
+            'heat': {'points': heat_noise,
+                     'options': {'radius': 15, 'blur': 10, 'maxZoom': 1, 'gradient': heat_gradient}},
+            'markers': [{
+                'lat': row['latitude'],
+                'lon': row['longitude'],
+                'popup': f"{row['station_name']}: {row['db_a']:.1f} dB (flagged: {row['flag']})",
+                'color': 'orange',
+                'fill_opacity': 0.8,
+            } for _, row in flagged_noise.iterrows()],
+        },
+        {'name': 'Patients', 'markers': circles},
+    ])
+else:
+    # Create map
+    m = folium.Map(location=[49.9929, 8.2473], zoom_start=11)
+
+    # Create feature groups for each layer
+    noise_group = FeatureGroup(name='Aircraft Noise', show=True)
+    patient_group = FeatureGroup(name='Patients', show=True)
+
+    # Add noise layer (red heatmap)
+    HeatMap(heat_noise, 
+            name='Aircraft Noise',
+            gradient=heat_gradient,
+            radius=15,
+            blur=10,
+            max_zoom=1).add_to(noise_group)
+
+    # Mark stations whose noise reading was flagged by the anomaly detector
+    for _, row in flagged_noise.iterrows():
+        folium.Marker(
             location=[row['latitude'], row['longitude']],
-            radius=current_radius,
-            popup=f"{row['station_name']}: {num_patients} patients",
-            color='#1f77b4',  # A distinct blue color
+            popup=f"{row['station_name']}: {row['db_a']:.1f} dB (flagged: {row['flag']})",
+            icon=folium.Icon(color='orange', icon='warning-sign')
+        ).add_to(noise_group)
+
+    # Add patient markers (concentric circles)
+    for circle in circles:
+        CircleMarker(
+            location=[circle['lat'], circle['lon']],
+            radius=circle['radius'],
+            popup=circle['popup'],
+            color=circle['color'],
             fill=True,
-            fill_color='#1f77b4',
-            fill_opacity=0.2,  # Very transparent
-            weight=2,  # Thicker border
-            opacity=0.8  # More visible border
+            fill_color=circle['fill_color'],
+            fill_opacity=circle['fill_opacity'],
+            weight=circle['weight'],
+            opacity=circle['opacity']
         ).add_to(patient_group)
 
-# Add feature groups to map
-noise_group.add_to(m)
-patient_group.add_to(m)
+    # Add feature groups to map
+    noise_group.add_to(m)
+    patient_group.add_to(m)
 
-# Add layer control
-folium.LayerControl().add_to(m)
+    # Add layer control
+    folium.LayerControl().add_to(m)
 
-# Display the map
-folium_static(m)
+# Display the map and report how much HTML this render sent
+payload_bytes = show_map(m)
+st.caption(f"Map payload: {payload_bytes / 1024:.1f} KB")
 
 # Optional: Add summary info
 col1, col2 = st.columns(2)
 with col1:
     st.metric("Mean Noise (dB)", f"{filtered_noise['db_a'].mean():.1f}")
 with col2:
-    st.metric("Total Patients", f"{filtered_patients['patient_count'].sum()}")
+    st.metric("Total Patients", f"{filtered_patients['patient_count'].sum():.0f}")
 
 # Add legend with more details
 st.markdown("""
@@ -164,12 +254,16 @@ st.markdown("""
   - Blue circles: Size indicates number of patients
   - Multiple concentric circles: Higher patient density
   - Click on circles to see exact patient count
+
+- 🟠 Flagged Points:
+  - Orange circles and warning markers: readings flagged by the anomaly detector
+  - Tick "Exclude flagged points" to leave outliers, flat and implausible readings out of the map
 """)
 
 # Add instructions
 st.markdown("""
 ### How to Use
-1. Use the date slider to select a time period
+1. Use the date slider to select a month, or switch to Date Range to aggregate over several months
 2. Toggle layers on/off using the layer control in the top right of the map
 3. Click on patient circles to see detailed information
 4. The heatmap shows aircraft noise intensity across the area
@@ -0,0 +1,229 @@
+"""Self-hosted map assets and the lightweight map rendering mode.
+
+`folium_static` embeds a complete HTML document on every rerun, with Leaflet, the
+heatmap plugin, jQuery and Bootstrap loaded from external CDNs and the legend and
+temperature boxes inlined again each time. The lightweight mode instead:
+
+- serves Leaflet, leaflet.heat and the app's own renderer (static/mainz_map.js)
+  from src/static through the data API, with `?v=<content hash>` URLs that are
+  cached for a year,
+- emits per render only a short HTML shell with the period's data as JSON.
+
+The asset URLs are resolved by the browser, so by default they point at
+`/mainz-assets` on the app's own origin, which the supervisor's proxy forwards to the
+data API it runs. This works for local, network and ngrok (HTTPS) clients alike.
+When the assets cannot be reached (e.g. a plain `streamlit run`), the app warns and
+inlines the renderer instead, loading Leaflet from its CDN.
+
+Vendor files are fetched once on a machine with internet access and can then be
+copied to an air-gapped deployment together with src/static:
+
+    python src/map_assets.py fetch
+    python src/supervisor.py --workers 4     # app, data API and /mainz-assets on one port
+
+A separately hosted data API can be used with
+`MAINZ_ASSET_URL=http://<host>:8600/static`.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import sys
+import urllib.error
+import urllib.request
+from functools import lru_cache
+
+import folium
+import streamlit as st
+import streamlit.components.v1 as components
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+# Same-origin path proxied to the data API by supervisor.py (see ASSET_PREFIX there)
+ASSET_BASE_URL = os.environ.get('MAINZ_ASSET_URL', '/mainz-assets').rstrip('/')
+# Server-side address of the data API, set by the supervisor for its workers
+ASSET_SERVER = os.environ.get('MAINZ_ASSET_SERVER')
+TILE_URL = os.environ.get('MAINZ_TILE_URL', 'https://{s}.tile.openstreetmap.org/{z}/{x}/{y}.png')
+TILE_ATTRIBUTION = os.environ.get('MAINZ_TILE_ATTRIBUTION', '&copy; OpenStreetMap contributors')
+
+MAP_CENTER = [49.9929, 8.2473]
+MAP_ZOOM = 11
+
+# Pinned to the Leaflet release folium 0.15.1 uses and to the folium tag in
+# requirements.txt; every download must match its sha256 before it is written
+LEAFLET_DIST = 'https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/'
+FOLIUM_TEMPLATES = 'https://cdn.jsdelivr.net/gh/python-visualization/folium@v0.15.1/folium/templates/'
+VENDOR_ASSETS = {
+    'vendor/leaflet.js': (LEAFLET_DIST + 'leaflet.js',
+                          '5819285cec137b229c94e1ee5ad73e8b6b84345a4367d60f75fe477fe0fb7b03'),
+    'vendor/leaflet.css': (LEAFLET_DIST + 'leaflet.css',
+                           '90b693d86392a4779c861b28cf307e7e59c3fb35328c4d8b95f58f814d38c722'),
+    # Referenced relative to leaflet.css by the layer control and default markers
+    'vendor/images/layers.png': (LEAFLET_DIST + 'images/layers.png',
+                                 '1dbbe9d028e292f36fcba8f8b3a28d5e8932754fc2215b9ac69e4cdecf5107c6'),
+    'vendor/images/layers-2x.png': (LEAFLET_DIST + 'images/layers-2x.png',
+                                    '066daca850d8ffbef007af00b06eac0015728dee279c51f3cb6c716df7c42edf'),
+    'vendor/images/marker-icon.png': (LEAFLET_DIST + 'images/marker-icon.png',
+                                      '574c3a5cca85f4114085b6841596d62f00d7c892c7b03f28cbfa301deb1dc437'),
+    'vendor/images/marker-icon-2x.png': (LEAFLET_DIST + 'images/marker-icon-2x.png',
+                                         '00179c4c1ee830d3a108412ae0d294f55776cfeb085c60129a39aa6fc4ae2528'),
+    'vendor/images/marker-shadow.png': (LEAFLET_DIST + 'images/marker-shadow.png',
+                                        '264f5c640339f042dd729062cfc04c17f8ea0f29882b538e3848ed8f10edb4da'),
+    'vendor/leaflet-heat.js': (FOLIUM_TEMPLATES + 'leaflet_heat.min.js',
+                               '7378c428ff2318ec48e7e73c0d46061f938aa75551c519c74cd790b044dfa0fa'),
+}
+
+def _sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+def fetch_vendor_assets(force=False):
+    """Download the vendor files into src/static/vendor, verifying each sha256.
+
+    Files already present with the expected hash are skipped; a mismatching download
+    raises ValueError and nothing is written for it.
+    """
+    for name, (url, sha256) in VENDOR_ASSETS.items():
+        path = os.path.join(STATIC_DIR, name)
+        if os.path.exists(path) and not force:
+            with open(path, 'rb') as f:
+                if _sha256(f.read()) == sha256:
+                    continue
+            logging.warning(f"{name} does not match its pinned sha256, fetching it again")
+        logging.info(f"Fetching {url}")
+        with urllib.request.urlopen(url, timeout=30) as response:
+            data = response.read()
+        if _sha256(data) != sha256:
+            raise ValueError(f"sha256 mismatch for {url}: expected {sha256}, got {_sha256(data)}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        print(f"Saved {name} ({len(data)} bytes)")
+
+# Files the lightweight renderer loads, in the order render_fragment includes them
+RENDERER_ASSETS = ['vendor/leaflet.css', 'mainz_map.css', 'vendor/leaflet.js', 'vendor/leaflet-heat.js', 'mainz_map.js']
+
+def asset_url(name):
+    """Versioned URL of a static asset, falling back to its CDN if it was never fetched"""
+    path = os.path.join(STATIC_DIR, name)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        # Not cached, so a worker picks the file up as soon as it is fetched
+        logging.warning(f"{name} not found in {STATIC_DIR}, run 'python src/map_assets.py fetch'")
+        return VENDOR_ASSETS[name][0]
+    return _versioned_url(name, mtime)
+
+@lru_cache(maxsize=None)
+def _versioned_url(name, mtime):
+    """Keyed by modification time, so a re-fetched file gets a new version"""
+    with open(os.path.join(STATIC_DIR, name), 'rb') as f:
+        version = hashlib.sha1(f.read()).hexdigest()[:12]
+    return f"{ASSET_BASE_URL}/{name}?v={version}"
+
+@st.cache_data(ttl=60, show_spinner=False)
+def unreachable_assets():
+    """Renderer assets the asset server does not serve, checked from the app server at most once a minute"""
+    if ASSET_BASE_URL.startswith(('http://', 'https://')):
+        base_url = ASSET_BASE_URL
+    elif ASSET_SERVER:
+        base_url = f"{ASSET_SERVER.rstrip('/')}/static"
+    else:
+        # A same-origin path only works behind the supervisor's proxy
+        return list(RENDERER_ASSETS)
+    missing = []
+    for name in RENDERER_ASSETS:
+        request = urllib.request.Request(f"{base_url}/{name}", method='HEAD')
+        try:
+            with urllib.request.urlopen(request, timeout=2) as response:
+                if response.status != 200:
+                    missing.append(name)
+        except (urllib.error.URLError, OSError):
+            missing.append(name)
+    return missing
+
+@lru_cache(maxsize=None)
+def _inline_renderer():
+    """mainz_map.js and mainz_map.css as inline tags, for when the asset server is unreachable"""
+    with open(os.path.join(STATIC_DIR, 'mainz_map.css')) as f:
+        css = f.read()
+    with open(os.path.join(STATIC_DIR, 'mainz_map.js')) as f:
+        js = f.read()
+    return f'<style>{css}</style><script>{js}</script>'
+
+def map_payload(layers, temperature=None, legend=None):
+    """Per-render data for static/mainz_map.js"""
+    return {
+        'center': MAP_CENTER,
+        'zoom': MAP_ZOOM,
+        'tiles': {'url': TILE_URL, 'attribution': TILE_ATTRIBUTION},
+        'layers': layers,
+        'temperature': None if temperature is None else round(float(temperature), 2),
+        'legend': legend,
+    }
+
+def folium_heat_options(options):
+    """folium HeatMap keyword arguments for the leaflet.heat options of a payload layer"""
+    return {re.sub(r'([A-Z])', lambda m: '_' + m.group(1).lower(), key): value for key, value in options.items()}
+
+def render_fragment(payload, height=500, inline=False):
+    """Minimal HTML document that loads the cached assets and renders one payload.
+
+    With `inline`, the renderer is embedded and Leaflet is loaded from its CDN, so the
+    map works without the asset server.
+    """
+    # Keep '</script>' inside popup text from closing the script element
+    data = json.dumps(payload, separators=(',', ':')).replace('</', '<\\/')
+    if inline:
+        assets = (
+            f'<link rel="stylesheet" href="{VENDOR_ASSETS["vendor/leaflet.css"][0]}">'
+            f'<script src="{VENDOR_ASSETS["vendor/leaflet.js"][0]}"></script>'
+            f'<script src="{VENDOR_ASSETS["vendor/leaflet-heat.js"][0]}"></script>'
+            + _inline_renderer()
+        )
+    else:
+        assets = (
+            f'<link rel="stylesheet" href="{asset_url("vendor/leaflet.css")}">'
+            f'<link rel="stylesheet" href="{asset_url("mainz_map.css")}">'
+            f'<script src="{asset_url("vendor/leaflet.js")}"></script>'
+            f'<script src="{asset_url("vendor/leaflet-heat.js")}"></script>'
+            f'<script src="{asset_url("mainz_map.js")}"></script>'
+        )
+    return (
+        '<!DOCTYPE html><html><head><meta charset="utf-8">'
+        + assets +
+        f'</head><body><div id="map" style="height:{height}px"></div>'
+        f'<script>MainzMap.render("map",{data});</script></body></html>'
+    )
+
+def show_map(map_or_payload, width=700, height=500):
+    """Display a folium map or a lightweight payload; returns the HTML payload size in bytes"""
+    if isinstance(map_or_payload, dict):
+        missing = unreachable_assets()
+        inline = bool(missing)
+        if len(missing) == len(RENDERER_ASSETS):
+            st.warning(f"The map asset server ({ASSET_BASE_URL}) is not reachable; the lightweight map "
+                       "loads Leaflet from its CDN instead. Start the app with "
+                       "'python src/supervisor.py' to serve the assets locally.")
+        elif missing:
+            st.warning(f"The map asset server ({ASSET_BASE_URL}) does not serve {', '.join(missing)}; "
+                       "the lightweight map loads Leaflet from its CDN instead. Run "
+                       "'python src/map_assets.py fetch' and restart the app to serve them locally.")
+        html = render_fragment(map_or_payload, height, inline)
+        components.html(html, height=height + 10, width=width)
+    else:
+        # Same rendering as streamlit_folium.folium_static
+        figure = folium.Figure().add_child(map_or_payload)
+        html = figure.render()
+        components.html(html, height=(figure.height or height) + 10, width=width)
+    size = len(html.encode('utf-8'))
+    logging.info(f"Map payload: {size} bytes")
+    return size
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    if sys.argv[1:] == ['fetch']:
+        fetch_vendor_assets()
+    elif sys.argv[1:] == ['fetch', '--force']:
+        fetch_vendor_assets(force=True)
+    else:
+        print("Usage: python src/map_assets.py fetch [--force]")
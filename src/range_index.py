@@ -0,0 +1,114 @@
+"""Prefix-sum index for constant-time date-range aggregates per station.
+
+The monthly station values are laid out on a dense month axis and stored as
+cumulative sums, so the mean or total over any month range is two array lookups
+per station, independent of the length of the range:
+
+    sum(start..end) = cumsum[end + 1] - cumsum[start]
+
+For noise levels both the arithmetic mean and the energy mean (Leq-style mean of
+10^(dB/10), converted back to dB) are available.
+"""
+import numpy as np
+import pandas as pd
+
+from data_loader import station_coords
+
+def _month_number(date):
+    return date.year * 12 + date.month - 1
+
+def _cumulative(matrix):
+    """Prefix sums along the month axis with a leading zero column"""
+    out = np.zeros((matrix.shape[0], matrix.shape[1] + 1))
+    np.cumsum(matrix, axis=1, out=out[:, 1:])
+    return out
+
+class RangeIndex:
+    """Cumulative sum/count arrays per station, built once at load time"""
+
+    def __init__(self, weather, patients, noise_data):
+        dates = pd.concat([weather['date'], patients['date'], noise_data['date']])
+        self.first_month = _month_number(dates.min())
+        last_month = _month_number(dates.max())
+        self.months = pd.date_range(dates.min().to_period('M').to_timestamp(),
+                                    periods=last_month - self.first_month + 1, freq='MS')
+        self.stations = sorted(set(noise_data['station_name']) | set(patients['station_name']))
+
+        db_a = self._station_matrix(noise_data, 'db_a', 'mean')
+        patient_count = self._station_matrix(patients, 'patient_count', 'sum')
+        temperature = self._series_matrix(weather, 'TT_10')
+
+        self.db_a_sum = _cumulative(np.nan_to_num(db_a))
+        self.db_a_energy = _cumulative(np.where(np.isnan(db_a), 0.0, 10 ** (db_a / 10)))
+        self.db_a_count = _cumulative(~np.isnan(db_a))
+        self.patient_sum = _cumulative(np.nan_to_num(patient_count))
+        self.patient_count = _cumulative(~np.isnan(patient_count))
+        self.temperature_sum = _cumulative(np.nan_to_num(temperature))[0]
+        self.temperature_count = _cumulative(~np.isnan(temperature))[0]
+
+    def _positions(self, dates):
+        return np.array([_month_number(d) for d in dates]) - self.first_month
+
+    def _station_matrix(self, data, column, how):
+        """Dense stations x months matrix of one column, NaN where a month is missing"""
+        matrix = np.full((len(self.stations), len(self.months)), np.nan)
+        grouped = data.groupby(['station_name', 'date'])[column].agg(how).reset_index()
+        rows = grouped['station_name'].map({name: i for i, name in enumerate(self.stations)}).to_numpy()
+        matrix[rows, self._positions(grouped['date'])] = grouped[column].to_numpy()
+        return matrix
+
+    def _series_matrix(self, data, column):
+        matrix = np.full((1, len(self.months)), np.nan)
+        grouped = data.groupby('date')[column].mean()
+        matrix[0, self._positions(grouped.index)] = grouped.to_numpy()
+        return matrix
+
+    def _bounds(self, start, end):
+        """Clip a month range to the index and return prefix-sum positions (lo, hi)"""
+        lo = min(max(_month_number(start) - self.first_month, 0), len(self.months))
+        hi = min(_month_number(end) - self.first_month + 1, len(self.months))
+        return lo, max(hi, lo)
+
+    # Data-driven selectors
+
+    def years(self):
+        """Years that have any data, for year selectors"""
+        return sorted(self.months.year.unique().tolist())
+
+    def months_for_year(self, year):
+        """Months (1-12) of a year that fall inside the data range"""
+        return self.months[self.months.year == year].month.tolist()
+
+    # Range aggregates
+
+    def mean_temperature(self, start, end):
+        lo, hi = self._bounds(start, end)
+        count = self.temperature_count[hi] - self.temperature_count[lo]
+        return (self.temperature_sum[hi] - self.temperature_sum[lo]) / count if count else np.nan
+
+    def aggregate(self, start, end):
+        """Per-station aggregates between two months (inclusive) as a DataFrame.
+
+        Columns match the monthly frames where possible (`db_a`, `patient_count`,
+        `latitude`, `longitude`), so the result can be mapped like a single month.
+        `db_a` is the arithmetic mean, `db_a_energy` the energy mean and
+        `patient_count` the total over the range.
+        """
+        lo, hi = self._bounds(start, end)
+        noise_months = self.db_a_count[:, hi] - self.db_a_count[:, lo]
+        patient_months = self.patient_count[:, hi] - self.patient_count[:, lo]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            db_a = (self.db_a_sum[:, hi] - self.db_a_sum[:, lo]) / noise_months
+            db_a_energy = 10 * np.log10((self.db_a_energy[:, hi] - self.db_a_energy[:, lo]) / noise_months)
+        patient_total = np.where(patient_months > 0, self.patient_sum[:, hi] - self.patient_sum[:, lo], np.nan)
+        result = pd.DataFrame({
+            'station_name': self.stations,
+            'db_a': db_a,
+            'db_a_energy': db_a_energy,
+            'noise_months': noise_months.astype(int),
+            'patient_count': patient_total,
+            'patient_months': patient_months.astype(int),
+        })
+        result['latitude'] = result['station_name'].map(lambda x: station_coords.get(x, [None, None])[0])
+        result['longitude'] = result['station_name'].map(lambda x: station_coords.get(x, [None, None])[1])
+        return result
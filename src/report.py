@@ -0,0 +1,185 @@
+"""Headless batch reports of station-wise breakdowns.
+
+Imports only the data layer (pandas, no Streamlit or folium), so it starts fast and
+can fan reports out over a process pool. Each period produces one table with the
+total patients, mean dB level and mean temperature per station.
+
+Periods are given as YYYY-MM (one month), YYYY (one year) or YYYY-MM:YYYY-MM
+(an inclusive range of months):
+
+    python src/report.py --periods 2018-10 2019 2018-10:2020-03 --out reports
+    python src/report.py --stations Weisenau Bretzenheim --format parquet
+    python src/report.py --benchmark
+"""
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from multiprocessing import Pool
+
+import pandas as pd
+
+from data_loader import read_data, station_breakdown, station_coords
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Data loaded once per worker process by _init_worker
+_worker_data = None
+
+def parse_period(spec):
+    """Return (label, start_date, end_date) for a period spec"""
+    try:
+        if ':' in spec:
+            start, end = spec.split(':', 1)
+            start_date = pd.to_datetime(start, format='%Y-%m')
+            end_date = pd.to_datetime(end, format='%Y-%m')
+            if end_date < start_date:
+                raise ValueError(spec)
+            return f"{start}_to_{end}", start_date, end_date
+        if len(spec) == 4:
+            start_date = pd.to_datetime(spec, format='%Y')
+            return spec, start_date, start_date + pd.DateOffset(months=11)
+        start_date = pd.to_datetime(spec, format='%Y-%m')
+        return spec, start_date, start_date
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid period '{spec}' (expected YYYY-MM, YYYY or YYYY-MM:YYYY-MM)")
+
+def _init_worker(data_dir):
+    global _worker_data
+    _worker_data = read_data(data_dir)
+
+def build_report(task):
+    """Compute and write one breakdown table; returns (label, rows, seconds, path, has_data)"""
+    (label, start_date, end_date), stations, out_dir, file_format = task
+    started = time.perf_counter()
+    weather, patients, noise_data = _worker_data
+    breakdown = station_breakdown(patients, noise_data, weather, start_date, end_date, stations)
+    breakdown.insert(0, 'period', label)
+
+    path = os.path.join(out_dir, f"station_breakdown_{label}.{file_format}")
+    if file_format == 'parquet':
+        breakdown.to_parquet(path, index=False)
+    else:
+        breakdown.to_csv(path, index=False)
+    has_data = bool(((breakdown['patient_count'] > 0) | (breakdown['noise_months'] > 0)).any())
+    return label, len(breakdown), time.perf_counter() - started, path, has_data
+
+def run_reports(periods, stations, out_dir, file_format, workers, data_dir=None):
+    os.makedirs(out_dir, exist_ok=True)
+    tasks = [(period, stations, out_dir, file_format) for period in periods]
+    if workers <= 1:
+        _init_worker(data_dir)
+        return [build_report(task) for task in tasks]
+    with Pool(workers, initializer=_init_worker, initargs=(data_dir,)) as pool:
+        return pool.map(build_report, tasks, chunksize=max(1, len(tasks) // (workers * 4)))
+
+def all_months(data_dir=None):
+    """Every month with patient or noise data, as period specs"""
+    _, patients, noise_data = read_data(data_dir)
+    dates = sorted(set(patients['date']) | set(noise_data['date']))
+    return [d.strftime('%Y-%m') for d in dates]
+
+# Benchmark of the headless path against the app-based path. Each snippet runs in a
+# fresh interpreter so import costs are measured from a cold start.
+
+HEADLESS_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import pandas as pd
+from data_loader import read_data, station_breakdown
+t1 = time.perf_counter()
+weather, patients, noise_data = read_data()
+t2 = time.perf_counter()
+months = sorted(patients['date'].unique())
+for month in months:
+    station_breakdown(patients, noise_data, weather, month, month)
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'load': t2 - t1, 'per_report': (t3 - t2) / len(months)}))
+"""
+
+# Mirrors what a rerun of the apps does for one month: the Streamlit module import
+# (which pulls in folium and calls set_page_config), the cached loader and the
+# filter + merge that builds the station-wise breakdown table.
+APP_SNIPPET = """
+import json, logging, time, warnings
+warnings.filterwarnings('ignore')
+t0 = time.perf_counter()
+import streamlit_app
+t1 = time.perf_counter()
+logging.disable(logging.CRITICAL)
+_, weather, patients, noise_data = streamlit_app.load_data()
+t2 = time.perf_counter()
+months = sorted(patients['date'].unique())
+for month in months:
+    filtered_patients = streamlit_app.filter_data_by_date(patients, month, 'Monthly')
+    filtered_noise = streamlit_app.filter_data_by_date(noise_data, month, 'Monthly')
+    station_data = filtered_patients.merge(filtered_noise[['station_name', 'db_a']], on='station_name', how='left')
+    station_data = station_data[['station_name', 'patient_count', 'db_a']].sort_values('patient_count', ascending=False)
+t3 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'load': t2 - t1, 'per_report': (t3 - t2) / len(months)}))
+"""
+
+def _time_snippet(snippet):
+    result = subprocess.run([sys.executable, '-c', snippet], cwd=SRC_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        last_line = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'unknown error'
+        return None, last_line
+    return json.loads(result.stdout.strip().splitlines()[-1]), None
+
+def benchmark(repeat=3):
+    """Print startup, load and per-report times for the headless and app-based paths"""
+    print(f"{'path':<10} {'import (s)':>11} {'load (s)':>9} {'per report (ms)':>16}")
+    for name, snippet in (('headless', HEADLESS_SNIPPET), ('app', APP_SNIPPET)):
+        runs = []
+        for _ in range(repeat):
+            timings, error = _time_snippet(snippet)
+            if timings is None:
+                print(f"{name:<10} unavailable: {error}")
+                break
+            runs.append(timings)
+        if runs:
+            best = {key: min(run[key] for run in runs) for key in runs[0]}
+            print(f"{name:<10} {best['import']:>11.3f} {best['load']:>9.3f} {best['per_report'] * 1000:>16.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Write station-wise breakdown reports without Streamlit')
+    parser.add_argument('--periods', nargs='+', type=parse_period,
+                        help='YYYY-MM, YYYY or YYYY-MM:YYYY-MM (default: every month in the data)')
+    parser.add_argument('--stations', nargs='+', choices=sorted(station_coords), metavar='STATION',
+                        help=f"Stations to include (default: all with data): {', '.join(sorted(station_coords))}")
+    parser.add_argument('--format', choices=['csv', 'parquet'], default='csv', dest='file_format')
+    parser.add_argument('--out', default='reports', help='Output directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Compare startup and per-report time with the app-based path')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Log the time of each report')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    if args.benchmark:
+        benchmark()
+        return
+
+    if args.file_format == 'parquet':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            parser.error("--format parquet requires pyarrow (pip install pyarrow)")
+
+    periods = args.periods or [parse_period(spec) for spec in all_months()]
+    started = time.perf_counter()
+    results = run_reports(periods, args.stations, args.out, args.file_format, args.workers)
+    elapsed = time.perf_counter() - started
+
+    for label, rows, seconds, path, has_data in results:
+        logging.info(f"{label}: {rows} stations in {seconds * 1000:.1f} ms -> {path}")
+        if not has_data:
+            logging.warning(f"{label}: no patient or noise data in this period")
+    print(f"Wrote {len(results)} reports to {args.out} in {elapsed:.2f}s using {args.workers} worker(s)")
+
+if __name__ == '__main__':
+    main()
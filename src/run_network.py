@@ -1,6 +1,7 @@
-import streamlit as st
-import subprocess
+import argparse
+import asyncio
 import socket
+from supervisor import Supervisor, add_arguments
 
 def get_local_ip():
     s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -14,24 +15,26 @@ def get_local_ip():
         s.close()
     return IP
 
+parser = argparse.ArgumentParser(description='Serve the Streamlit workers on the local network')
+add_arguments(parser)
+args = parser.parse_args()
+
 # Get local IP address
 local_ip = get_local_ip()
 
-# Start Streamlit with network access
-streamlit_process = subprocess.Popen(['streamlit', 'run', 'streamlit_app.py', '--server.address', local_ip])
+# Start the workers behind a proxy listening on all interfaces
+supervisor = Supervisor(args.workers, '0.0.0.0', args.port, args.base_port, api_port=args.api_port)
 
-print(f"\nYour Streamlit app is now available at:")
-print(f"Local URL: http://localhost:8501")
-print(f"Network URL: http://{local_ip}:8501")
-print("\nShare the Network URL with anyone on your local network.")
-print("Note: This will only work for devices connected to the same network.")
-print("\nPress Ctrl+C to stop the server.")
+def announce():
+    print(f"\nYour Streamlit app is now available at:")
+    print(f"Local URL: http://localhost:{args.port}")
+    print(f"Network URL: http://{local_ip}:{args.port}")
+    print("\nShare the Network URL with anyone on your local network.")
+    print("Note: This will only work for devices connected to the same network.")
+    print("\nPress Ctrl+C to stop the server.")
 
 try:
-    # Keep the script running
-    while True:
-        streamlit_process.wait()
+    asyncio.run(supervisor.run(on_ready=announce))
 except KeyboardInterrupt:
-    # Clean up
-    streamlit_process.terminate()
-    print("\nServer stopped.") 
\ No newline at end of file
+    pass
+print("\nServer stopped.")
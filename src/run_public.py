@@ -1,28 +1,28 @@
-import streamlit as st
 from pyngrok import ngrok
-import subprocess
-import time
-import os
+import argparse
+import asyncio
+from supervisor import Supervisor, add_arguments
 
-# Start Streamlit in a subprocess
-streamlit_process = subprocess.Popen(['streamlit', 'run', 'streamlit_app.py'])
+parser = argparse.ArgumentParser(description='Expose the Streamlit workers publicly through ngrok')
+add_arguments(parser)
+args = parser.parse_args()
 
-# Wait for Streamlit to start
-time.sleep(5)
+# Start the workers behind a local proxy
+supervisor = Supervisor(args.workers, '127.0.0.1', args.port, args.base_port, api_port=args.api_port)
 
-# Create a public URL with ngrok
-public_url = ngrok.connect(8501)
-print(f"\nYour Streamlit app is now available at: {public_url}\n")
-print("Share this URL with anyone to give them access to your app.")
-print("Note: This URL will change each time you restart the script.")
-print("\nPress Ctrl+C to stop the server.")
+def expose():
+    # Create a public URL with ngrok once a worker is ready to serve traffic
+    public_url = ngrok.connect(args.port)
+    print(f"\nYour Streamlit app is now available at: {public_url}\n")
+    print("Share this URL with anyone to give them access to your app.")
+    print("Note: This URL will change each time you restart the script.")
+    print("\nPress Ctrl+C to stop the server.")
 
 try:
-    # Keep the script running
-    while True:
-        time.sleep(1)
+    asyncio.run(supervisor.run(on_ready=expose))
 except KeyboardInterrupt:
+    pass
+finally:
     # Clean up
     ngrok.kill()
-    streamlit_process.terminate()
-    print("\nServer stopped.") 
\ No newline at end of file
+    print("\nServer stopped.")
@@ -1,15 +1,14 @@
 import streamlit as st
 import pandas as pd
 import folium
-from folium import plugins
-from streamlit_folium import folium_static
-import glob
 import logging
-from datetime import datetime
 import numpy as np
-import os
-import re
 from folium.plugins import HeatMap
+from data_loader import read_data, filter_data_by_range, station_breakdown
+from range_index import RangeIndex
+from exposure import ExposureModel, patient_districts
+from anomaly import detect_anomalies, mark_flags, exclude_flagged
+from map_assets import folium_heat_options, map_payload, show_map
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,55 +16,36 @@ logging.basicConfig(level=logging.DEBUG)
 # Set page config
 st.set_page_config(page_title="Mainz Data Visualization", layout="wide")
 
-# Define station coordinates
-station_coords = {
-    'Ebersheim': (49.9275, 8.3458),
-    'Finthen': (49.9733, 8.1750),
-    'Gonsenheim': (49.9833, 8.2167),
-    'Hartenberg': (49.9833, 8.2667),
-    'Hechtsheim': (49.9667, 8.2500),
-    'Laubenheim': (49.9333, 8.3000),
-    'Lerchenberg': (49.9833, 8.2333),
-    'Marienborn': (49.9667, 8.2167),
-    'Mombach': (49.9833, 8.2167),
-    'Neustadt': (49.9833, 8.2667),
-    'Oberstadt': (49.9833, 8.2667),
-    'Weisenau': (49.9667, 8.2833),
-    'Bretzenheim': (49.9833, 8.2333)
-}
-
+# Same loading as the main app and the batch report, with multi-file stations averaged
 @st.cache_data
 def load_data():
-    # Get the current directory (src) and go up one level to find the data directory
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    data_dir = os.path.join(os.path.dirname(current_dir), 'data')
-    
-    weather = pd.read_csv(os.path.join(data_dir, 'monthly_means_weather.csv'))
-    weather['date'] = pd.to_datetime(weather['month_year'], format='%B %Y')
-
-    patients = pd.read_csv(os.path.join(data_dir, 'monthly_patients_by_station.csv'))
-    patients['date'] = pd.to_datetime(patients['month_year'], format='%B %Y')
-    patients['station_name'] = patients['closest_station'].str.replace('Mainz/', '')
-    patients['latitude'] = patients['station_name'].map(lambda x: station_coords.get(x, [None, None])[0])
-    patients['longitude'] = patients['station_name'].map(lambda x: station_coords.get(x, [None, None])[1])
-
-    noise_files = glob.glob(os.path.join(data_dir, 'monthly_means_*.csv'))
-    noise_files = [f for f in noise_files if 'weather' not in f]
-    noise_dfs = []
-    for f in noise_files:
-        base_name = re.sub(r'monthly_means_|\.csv', '', os.path.basename(f))
-        base_name = re.sub(r'_\d+|_ooo', '', base_name)
-        if base_name in station_coords:
-            df = pd.read_csv(f)
-            df['station_name'] = base_name
-            df['date'] = pd.to_datetime(df['month_year'], format='%B %Y')
-            df['latitude'], df['longitude'] = station_coords[base_name]
-            noise_dfs.append(df)
-    noise_data = pd.concat(noise_dfs)
-
-    return weather, patients, noise_data
-
-def create_visualization(selected_date, patients, noise_data):
+    return read_data()
+
+# Update the anomaly detector with any new months and return all flagged points
+@st.cache_data
+def load_flags():
+    weather, patients, noise_data = load_data()
+    return detect_anomalies(patients, noise_data)
+
+# Build the prefix-sum index once per process for the date range view
+@st.cache_resource
+def load_index(exclude_flagged_points=False):
+    weather, patients, noise_data = load_data()
+    if exclude_flagged_points:
+        flags = load_flags()
+        patients = exclude_flagged(patients, flags, 'patient_count')
+        noise_data = exclude_flagged(noise_data, flags, 'db_a')
+    return RangeIndex(weather, patients, noise_data)
+
+# Exposure-weighted noise levels of the patient districts for every month
+@st.cache_resource
+def load_exposure(exclude_flagged_points=False):
+    weather, patients, noise_data = load_data()
+    if exclude_flagged_points:
+        noise_data = exclude_flagged(noise_data, load_flags(), 'db_a')
+    return ExposureModel(noise_data, patient_districts(patients))
+
+def create_visualization(selected_date, patients, noise_data, lightweight=False):
     # Filter data for selected date
     filtered_patients = patients[patients['date'].dt.strftime('%Y-%m') == selected_date.strftime('%Y-%m')].dropna(subset=['latitude', 'longitude'])
     filtered_noise = noise_data[noise_data['date'].dt.strftime('%Y-%m') == selected_date.strftime('%Y-%m')].dropna(subset=['latitude', 'longitude'])
@@ -75,15 +55,33 @@ def create_visualization(selected_date, patients, noise_data):
     st.write(f"Number of patient records: {len(filtered_patients)}")
     st.write(f"Number of noise records: {len(filtered_noise)}")
 
-    # Create map
-    m = folium.Map(location=[49.9929, 8.2473], zoom_start=11)
+    if lightweight:
+        return build_map_payload(filtered_patients, filtered_noise), filtered_patients, filtered_noise
+    return build_map(filtered_patients, filtered_noise), filtered_patients, filtered_noise
+
+def create_range_visualization(start_date, end_date, index, lightweight=False):
+    # Total patients and mean noise per station over the range, from the prefix-sum index
+    station_totals = index.aggregate(start_date, end_date).dropna(subset=['latitude', 'longitude'])
+    filtered_patients = station_totals[['station_name', 'latitude', 'longitude', 'patient_count']].dropna(subset=['patient_count'])
+    filtered_patients['patient_count'] = filtered_patients['patient_count'].astype(int)
+    filtered_noise = station_totals[['station_name', 'latitude', 'longitude', 'db_a']].dropna(subset=['db_a'])
+
+    st.write(f"Selected range: {start_date.strftime('%B %Y')} - {end_date.strftime('%B %Y')}")
+    st.write(f"Number of stations with patients: {len(filtered_patients)}")
+    st.write(f"Number of stations with noise data: {len(filtered_noise)}")
 
+    if lightweight:
+        return build_map_payload(filtered_patients, filtered_noise), filtered_patients, filtered_noise
+    return build_map(filtered_patients, filtered_noise), filtered_patients, filtered_noise
+
+def map_layers(filtered_patients, filtered_noise):
+    """Patient circles, noise heatmap and flagged noise stations, shared by both map modes"""
+    patient_markers = []
     if not filtered_patients.empty:
         # Calculate min and max patient counts for scaling
         min_patients = filtered_patients['patient_count'].min()
         max_patients = filtered_patients['patient_count'].max()
 
-        # Add patient circles
         for _, row in filtered_patients.iterrows():
             # Calculate circle radius based on patient count (scaled for visibility)
             base_size = 5  # Minimum circle size
@@ -95,31 +93,82 @@ def create_visualization(selected_date, patients, noise_data):
             # Calculate radius using logarithmic scaling
             radius = base_size + (max_size - base_size) * np.log1p(normalized_count * 9) / np.log1p(9)
             
-            # Create circle marker
-            folium.CircleMarker(
-                location=[row['latitude'], row['longitude']],
-                radius=radius,
-                popup=f"{row['station_name']}: {row['patient_count']} patients",
-                color='blue',
-                fill=True,
-                fill_color='blue',
-                fill_opacity=0.4,
-                weight=1,
-                name='Patients'
-            ).add_to(m)
+            # Outlined in orange if the count was flagged
+            flagged = row.get('flagged', False)
+            popup = f"{row['station_name']}: {row['patient_count']} patients"
+            if flagged:
+                popup += f" (flagged: {row['flag']})"
+            patient_markers.append({
+                'lat': row['latitude'],
+                'lon': row['longitude'],
+                'popup': popup,
+                'radius': round(float(radius), 2),
+                'color': 'orange' if flagged else 'blue',
+                'fill_color': 'blue',
+                'fill_opacity': 0.4,
+                'weight': 1,
+            })
 
+    heat_points = []
+    noise_markers = []
     if not filtered_noise.empty:
         # Normalize noise values for heatmap
-        filtered_noise['intensity'] = (filtered_noise['db_a'] - filtered_noise['db_a'].min()) / (filtered_noise['db_a'].max() - filtered_noise['db_a'].min() + 1e-5)
-        
-        # Add noise heatmap
-        heat_noise = [[row['latitude'], row['longitude'], row['intensity']] for _, row in filtered_noise.iterrows()]
-        HeatMap(
-            heat_noise,
-            name='Noise',
-            gradient={0.4: 'orange', 0.7: 'red', 1: 'darkred'},
-            radius=15,
-            opacity=0.6
+        intensity = (filtered_noise['db_a'] - filtered_noise['db_a'].min()) / (filtered_noise['db_a'].max() - filtered_noise['db_a'].min() + 1e-5)
+        heat_points = [[lat, lon, round(float(w), 4)] for lat, lon, w in
+                       zip(filtered_noise['latitude'], filtered_noise['longitude'], intensity)]
+
+        # Mark stations whose noise reading was flagged by the anomaly detector
+        if 'flagged' in filtered_noise:
+            for _, row in filtered_noise[filtered_noise['flagged']].drop_duplicates('station_name').iterrows():
+                noise_markers.append({
+                    'lat': row['latitude'],
+                    'lon': row['longitude'],
+                    'popup': f"{row['station_name']}: {row['db_a']:.1f} dB (flagged: {row['flag']})",
+                    'color': 'orange',
+                    'fill_opacity': 0.8,
+                })
+
+    return [
+        {'name': 'Patients', 'markers': patient_markers},
+        {
+            'name': 'Noise',
+            'heat': {
+                'points': heat_points,
+                'options': {'radius': 15, 'blur': 15, 'minOpacity': 0.5, 'maxZoom': 18,
+                            'gradient': {0.4: 'orange', 0.7: 'red', 1: 'darkred'}},
+            },
+            'markers': noise_markers,
+        },
+    ]
+
+def build_map(filtered_patients, filtered_noise):
+    # Create map
+    m = folium.Map(location=[49.9929, 8.2473], zoom_start=11)
+    patients_layer, noise_layer = map_layers(filtered_patients, filtered_noise)
+
+    # Add patient circles
+    for marker in patients_layer['markers']:
+        folium.CircleMarker(
+            location=[marker['lat'], marker['lon']],
+            radius=marker['radius'],
+            popup=marker['popup'],
+            color=marker['color'],
+            fill=True,
+            fill_color=marker['fill_color'],
+            fill_opacity=marker['fill_opacity'],
+            weight=marker['weight'],
+            name='Patients'
+        ).add_to(m)
+
+    # Add noise heatmap and warning markers for flagged stations
+    if noise_layer['heat']['points']:
+        HeatMap(noise_layer['heat']['points'], name='Noise',
+                **folium_heat_options(noise_layer['heat']['options'])).add_to(m)
+    for marker in noise_layer['markers']:
+        folium.Marker(
+            location=[marker['lat'], marker['lon']],
+            popup=marker['popup'],
+            icon=folium.Icon(color='orange', icon='warning-sign')
         ).add_to(m)
 
     # Add layer control
@@ -141,35 +190,78 @@ def create_visualization(selected_date, patients, noise_data):
     '''
     m.get_root().html.add_child(folium.Element(legend_html))
 
-    return m, filtered_patients, filtered_noise
+    return m
+
+def period_flags(data, start_date, end_date):
+    # Flag reasons per station over the period, one entry per distinct reason
+    flagged = filter_data_by_range(data, start_date, end_date)
+    flagged = flagged[flagged['flagged']]
+    return flagged.groupby('station_name')['flag'].agg(lambda x: ', '.join(sorted(set(', '.join(x).split(', ')))))
+
+def build_map_payload(filtered_patients, filtered_noise):
+    # Same layers as build_map, as data for the lightweight renderer
+    return map_payload(map_layers(filtered_patients, filtered_noise), legend='spatiotemporal')
 
 # Load data
 weather, patients, noise_data = load_data()
 
 st.title('Spatio-Temporal Visualization of Aircraft Noise and Patients')
 
-# Get unique dates and convert to datetime objects
-all_dates = np.unique(patients['date'].dt.to_pydatetime())
-min_date = all_dates[0]
-max_date = all_dates[-1]
+# Anomaly flags from the incremental detector
+exclude_flagged_points = st.checkbox("Exclude flagged points", value=False,
+                                     help="Drop outliers, flat and implausible readings before aggregating")
+flags = load_flags()
+if exclude_flagged_points:
+    patients = exclude_flagged(patients, flags, 'patient_count')
+    noise_data = exclude_flagged(noise_data, flags, 'db_a')
+patients = mark_flags(patients, flags, 'patient_count')
+noise_data = mark_flags(noise_data, flags, 'db_a')
+
+index = load_index(exclude_flagged_points)
+exposure = load_exposure(exclude_flagged_points)
+
+view = st.radio("View", ['Single Month', 'Date Range'], horizontal=True)
+lightweight = st.checkbox("Lightweight map", value=False,
+                          help="Load map libraries once from the self-hosted asset server")
 
-# Time slider with more descriptive format
-selected_date = st.slider(
-    "Select Month and Year",
-    min_value=min_date,
-    max_value=max_date,
-    value=min_date,
-    format="MMMM YYYY"  # Full month name and year
-)
+if view == 'Single Month':
+    # Get unique dates and convert to datetime objects
+    all_dates = np.unique(patients['date'].dt.to_pydatetime())
+    min_date = all_dates[0]
+    max_date = all_dates[-1]
 
-# Convert selected_date back to pandas Timestamp for filtering
-selected_date = pd.Timestamp(selected_date)
+    # Time slider with more descriptive format
+    selected_date = st.slider(
+        "Select Month and Year",
+        min_value=min_date,
+        max_value=max_date,
+        value=min_date,
+        format="MMMM YYYY"  # Full month name and year
+    )
 
-# Create visualization
-m, filtered_patients, filtered_noise = create_visualization(selected_date, patients, noise_data)
+    # Convert selected_date back to pandas Timestamp for filtering
+    selected_date = pd.Timestamp(selected_date)
+    period_label = selected_date.strftime('%B %Y')
+    start_date = end_date = selected_date
 
-# Display the map
-folium_static(m)
+    # Create visualization
+    m, filtered_patients, filtered_noise = create_visualization(selected_date, patients, noise_data, lightweight)
+else:
+    # Range slider over the months present in the data
+    start_date, end_date = st.select_slider(
+        "Select Date Range",
+        options=list(index.months),
+        value=(index.months[0], index.months[-1]),
+        format_func=lambda d: d.strftime('%b %Y')
+    )
+    period_label = f"{start_date.strftime('%B %Y')} - {end_date.strftime('%B %Y')}"
+
+    # Create visualization
+    m, filtered_patients, filtered_noise = create_range_visualization(start_date, end_date, index, lightweight)
+
+# Display the map and report how much HTML this render sent
+payload_bytes = show_map(m)
+st.caption(f"Map payload: {payload_bytes / 1024:.1f} KB")
 
 # Add comprehensive guide
 st.markdown("""
@@ -187,16 +279,23 @@ st.markdown("""
   - Light orange = lower noise
   - Dark red = higher noise
 - The noise values are in decibels (dB)
+- The breakdown's exposure_db_a column mixes the levels of nearby stations,
+  weighted by distance, so districts without a station also get a value
+
+#### Flagged Points (Orange)
+- Orange outlines and warning markers show readings flagged by the anomaly detector
+- Flags are outliers, flat (stuck) or implausible readings and change points
+- Tick "Exclude flagged points" to leave outliers, flat and implausible readings out of all aggregates
 
 #### How to Use
-1. Use the slider above to select different months
+1. Use the slider above to select different months, or switch to Date Range to aggregate over several months
 2. Toggle layers using the control in the top-right of the map
 3. Click on circles to see detailed information
 4. Use the layer control to show/hide patient or noise data
 """)
 
 # Add summary info
-st.subheader(f"Summary for {selected_date.strftime('%B %Y')}")
+st.subheader(f"Summary for {period_label}")
 col1, col2 = st.columns(2)
 with col1:
     st.metric("Mean Noise (dB)", f"{filtered_noise['db_a'].mean():.1f}")
@@ -205,10 +304,12 @@ with col2:
 
 # Add station-wise breakdown
 st.subheader("Station-wise Breakdown")
-station_data = filtered_patients.merge(
-    filtered_noise[['station_name', 'db_a']],
-    on='station_name',
-    how='left'
-)
-station_data = station_data[['station_name', 'patient_count', 'db_a']].sort_values('patient_count', ascending=False)
-st.dataframe(station_data.style.format({'db_a': '{:.1f}'})) 
\ No newline at end of file
+# Noise level weighted over the surrounding stations, also for districts without a station
+district_exposure = exposure.aggregate(start_date, end_date).set_index('station_name')['db_a']
+station_data = station_breakdown(patients, noise_data, weather, start_date, end_date)
+station_data['exposure_db_a'] = station_data['station_name'].map(district_exposure)
+station_data['patient_flag'] = station_data['station_name'].map(period_flags(patients, start_date, end_date)).fillna('')
+station_data['noise_flag'] = station_data['station_name'].map(period_flags(noise_data, start_date, end_date)).fillna('')
+station_data = station_data[['station_name', 'patient_count', 'db_a', 'noise_months', 'exposure_db_a',
+                             'patient_flag', 'noise_flag']]
+st.dataframe(station_data.style.format({'db_a': '{:.1f}', 'exposure_db_a': '{:.1f}'}))
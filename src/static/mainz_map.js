@@ -0,0 +1,83 @@
+/*
+ * Lightweight map renderer for the Mainz apps.
+ *
+ * Served once with long-lived cache headers; each render only ships a small JSON
+ * payload (see map_assets.py) that is passed to MainzMap.render:
+ *
+ *   {
+ *     "center": [lat, lon], "zoom": 11,
+ *     "tiles": {"url": "...", "attribution": "..."},
+ *     "layers": [{"name": "...", "heat": {"points": [[lat, lon, w], ...], "options": {...}},
+ *                 "markers": [{"lat": .., "lon": .., "popup": "..", "radius": .., "color": ..}]}],
+ *     "temperature": 12.3 or null,
+ *     "legend": "spatiotemporal" or null
+ *   }
+ */
+var MainzMap = (function () {
+    'use strict';
+
+    // Static overlay HTML lives here so it is not re-sent with every render
+    var LEGENDS = {
+        spatiotemporal:
+            '<p><strong>Map Legend</strong></p>' +
+            '<p><span style="color: blue;">&#9679;</span> Patient Count (Circle Size)</p>' +
+            '<p><span style="color: red;">&#9679;</span> Noise Level (Heatmap)</p>' +
+            '<p><span style="color: orange;">&#9679;</span> Flagged Reading</p>' +
+            '<p class="mainz-hint">Click on circles to see exact values</p>'
+    };
+
+    function addBox(map, className, html) {
+        var box = L.control({position: 'bottomright'});
+        box.onAdd = function () {
+            var div = L.DomUtil.create('div', className);
+            div.innerHTML = html;
+            return div;
+        };
+        box.addTo(map);
+    }
+
+    function addMarker(group, marker) {
+        var popup = document.createElement('span');
+        popup.textContent = marker.popup;
+        L.circleMarker([marker.lat, marker.lon], {
+            radius: marker.radius || 8,
+            color: marker.color || 'red',
+            fillColor: marker.fill_color || marker.color || 'red',
+            fill: true,
+            fillOpacity: marker.fill_opacity != null ? marker.fill_opacity : 0.4,
+            opacity: marker.opacity != null ? marker.opacity : 1.0,
+            weight: marker.weight || 2
+        }).bindPopup(popup).addTo(group);
+    }
+
+    function render(elementId, data) {
+        var map = L.map(elementId).setView(data.center, data.zoom);
+        L.tileLayer(data.tiles.url, {attribution: data.tiles.attribution, maxZoom: 19}).addTo(map);
+
+        var overlays = {};
+        data.layers.forEach(function (layer) {
+            var group = L.layerGroup();
+            if (layer.heat && layer.heat.points.length) {
+                L.heatLayer(layer.heat.points, layer.heat.options || {}).addTo(group);
+            }
+            (layer.markers || []).forEach(function (marker) {
+                addMarker(group, marker);
+            });
+            group.addTo(map);
+            overlays[layer.name] = group;
+        });
+        if (data.layers.length > 1) {
+            L.control.layers(null, overlays).addTo(map);
+        }
+
+        if (data.temperature != null) {
+            addBox(map, 'mainz-box', '<b>Mean Temperature: ' + data.temperature.toFixed(1) + '&deg;C</b>');
+        }
+        if (data.legend && LEGENDS[data.legend]) {
+            addBox(map, 'mainz-box mainz-legend', LEGENDS[data.legend]);
+        }
+        return map;
+    }
+
+    return {render: render};
+})();
@@ -2,14 +2,14 @@ import streamlit as st
 import pandas as pd
 import folium
 from folium import plugins
-from streamlit_folium import folium_static
-import glob
 import logging
 from datetime import datetime
 import numpy as np
-import os
-import re
-from folium.plugins import HeatMap
+from data_loader import read_data, filter_data_by_date
+from range_index import RangeIndex
+from exposure import ExposureModel, patient_districts
+from anomaly import detect_anomalies, mark_flags, exclude_flagged
+from map_assets import folium_heat_options, map_payload, show_map
 
 # Set up logging
 logging.basicConfig(level=logging.DEBUG)
@@ -17,115 +17,12 @@ logging.basicConfig(level=logging.DEBUG)
 # Set page config
 st.set_page_config(page_title="Mainz Data Visualization", layout="wide")
 
-# Define station coordinates
-station_coords = {
-    'Ebersheim': (49.9275, 8.3458),
-    'Finthen': (49.9733, 8.1750),
-    'Gonsenheim': (49.9833, 8.2167),
-    'Hartenberg': (49.9833, 8.2667),
-    'Hechtsheim': (49.9667, 8.2500),
-    'Laubenheim': (49.9333, 8.3000),
-    'Lerchenberg': (49.9833, 8.2333),
-    'Marienborn': (49.9667, 8.2167),
-    'Mombach': (49.9833, 8.2167),
-    'Neustadt': (49.9833, 8.2667),
-    'Oberstadt': (49.9833, 8.2667),
-    'Weisenau': (49.9667, 8.2833),
-    'Bretzenheim': (49.9833, 8.2333)
-}
-
-def get_base_station_name(filename):
-    """Extract base station name from filename, handling numbered stations"""
-    # Remove 'monthly_means_' prefix and '.csv' suffix
-    name = filename.replace('monthly_means_', '').replace('.csv', '')
-    
-    # Extract base name and number if present
-    match = re.match(r'([A-Za-z]+)(?:_(\d+))?(?:_ooo)?', name)
-    if match:
-        base_name = match.group(1)
-        number = match.group(2)
-        return base_name, number
-    return name, None
-
 # Function to load data
 @st.cache_data
 def load_data():
     try:
         logging.info("Starting to load data...")
-        
-        # Get the current directory
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        # Get the project root directory (one level up from src)
-        project_root = os.path.dirname(current_dir)
-        # Construct the data directory path
-        data_dir = os.path.join(project_root, 'data')
-        
-        # Load weather data first
-        logging.info("Loading weather data...")
-        weather_path = os.path.join(data_dir, 'monthly_means_weather.csv')
-        weather = pd.read_csv(weather_path)
-        weather['date'] = pd.to_datetime(weather['month_year'], format='%B %Y')
-        
-        # Load patient data
-        logging.info("Loading patient data...")
-        patients_path = os.path.join(data_dir, 'monthly_patients_by_station.csv')
-        patients = pd.read_csv(patients_path)
-        patients['date'] = pd.to_datetime(patients['month_year'], format='%B %Y')
-        
-        # Extract station name from closest_station (remove 'Mainz/' prefix)
-        patients['station_name'] = patients['closest_station'].str.replace('Mainz/', '')
-        
-        # Add coordinates to patient data
-        patients['latitude'] = patients['station_name'].map(lambda x: station_coords.get(x, [None, None])[0])
-        patients['longitude'] = patients['station_name'].map(lambda x: station_coords.get(x, [None, None])[1])
-        
-        # Log the number of patient records with missing coordinates
-        missing_coords = patients[patients['latitude'].isna() | patients['longitude'].isna()]
-        if not missing_coords.empty:
-            logging.warning(f"Found {len(missing_coords)} patient records with missing coordinates")
-            logging.warning(f"Stations with missing coordinates: {missing_coords['station_name'].unique()}")
-        
-        # Load aircraft noise data
-        logging.info("Loading aircraft noise data...")
-        noise_files = glob.glob(os.path.join(data_dir, 'monthly_means_*.csv'))
-        noise_files = [f for f in noise_files if 'weather' not in f]
-        
-        # Create a dictionary to store DataFrames by base station name
-        station_data_dict = {}
-        
-        for file in noise_files:
-            try:
-                df = pd.read_csv(file)
-                base_station, number = get_base_station_name(os.path.basename(file))
-                
-                if base_station in station_coords:
-                    df['station_name'] = base_station
-                    df['station_number'] = number
-                    df['date'] = pd.to_datetime(df['month_year'], format='%B %Y')
-                    df['latitude'] = station_coords[base_station][0]
-                    df['longitude'] = station_coords[base_station][1]
-                    
-                    if base_station not in station_data_dict:
-                        station_data_dict[base_station] = []
-                    station_data_dict[base_station].append(df)
-                else:
-                    logging.warning(f"Skipping unknown station: {base_station}")
-            except Exception as e:
-                logging.error(f"Error processing file {file}: {str(e)}")
-                continue
-        
-        # Combine data for stations with multiple measurements
-        noise_data = pd.DataFrame()
-        for base_station, dfs in station_data_dict.items():
-            if len(dfs) > 1:
-                # Multiple measurements exist, calculate mean
-                combined_df = pd.concat(dfs)
-                mean_df = combined_df.groupby(['month_year', 'date', 'station_name', 'latitude', 'longitude'])['db_a'].mean().reset_index()
-                noise_data = pd.concat([noise_data, mean_df], ignore_index=True)
-            else:
-                # Only one measurement exists, use it directly
-                noise_data = pd.concat([noise_data, dfs[0]], ignore_index=True)
-        
+        weather, patients, noise_data = read_data()
         logging.info("Data loading completed successfully")
         return None, weather, patients, noise_data
     except Exception as e:
@@ -133,83 +30,179 @@ def load_data():
         st.error(f"Error loading data: {str(e)}")
         return None, None, None, None
 
-def filter_data_by_date(data, selected_date, frequency):
-    """Filter data based on selected date and frequency"""
-    if frequency == 'Monthly':
-        return data[
-            (data['date'].dt.year == selected_date.year) & 
-            (data['date'].dt.month == selected_date.month)
-        ]
-    else:  # Annual
-        return data[data['date'].dt.year == selected_date.year]
+# Update the anomaly detector with any new months and return all flagged points
+@st.cache_data
+def load_flags():
+    _, weather, patients, noise_data = load_data()
+    return detect_anomalies(patients, noise_data)
+
+# Build the prefix-sum index once per process for range and trailing-window views
+@st.cache_resource
+def load_index(exclude_flagged_points=False):
+    _, weather, patients, noise_data = load_data()
+    if weather is None or patients is None or noise_data is None:
+        return None
+    if exclude_flagged_points:
+        flags = load_flags()
+        patients = exclude_flagged(patients, flags, 'patient_count')
+        noise_data = exclude_flagged(noise_data, flags, 'db_a')
+    return RangeIndex(weather, patients, noise_data)
+
+# Exposure-weighted noise levels of the patient districts for every month
+@st.cache_resource
+def load_exposure(exclude_flagged_points=False):
+    _, weather, patients, noise_data = load_data()
+    if weather is None or patients is None or noise_data is None:
+        return None
+    if exclude_flagged_points:
+        noise_data = exclude_flagged(noise_data, load_flags(), 'db_a')
+    return ExposureModel(noise_data, patient_districts(patients))
+
+def empty_map(lightweight=False):
+    """Map of Mainz without data layers"""
+    if lightweight:
+        return map_payload([])
+    return folium.Map(location=[49.9929, 8.2473], zoom_start=11)
 
 # Function to create a heatmap
-def create_heatmap(data, data_type, frequency, selected_date, weather_data=None):
+def create_heatmap(data, data_type, frequency, selected_date, weather_data=None, lightweight=False):
     try:
         logging.info(f"Creating heatmap for {data_type} with {frequency} frequency for date {selected_date}")
         
-        # Create a map centered at Mainz
-        m = folium.Map(location=[49.9929, 8.2473], zoom_start=11)
-        
         # Filter data based on selected date
         filtered_data = filter_data_by_date(data, selected_date, frequency)
         
         if filtered_data.empty:
             st.warning(f"No data available for {selected_date.strftime('%B %Y' if frequency == 'Monthly' else '%Y')}")
-            return m
-        
-        # Remove rows with missing coordinates
-        filtered_data = filtered_data.dropna(subset=['latitude', 'longitude'])
-        
-        if filtered_data.empty:
-            st.warning("No valid location data available for the selected period.")
-            return m
+            return empty_map(lightweight)
         
-        # Calculate and display mean temperature if weather data is provided
+        # Calculate mean temperature if weather data is provided
+        mean_temp = None
         if weather_data is not None:
             filtered_weather = filter_data_by_date(weather_data, selected_date, frequency)
             if not filtered_weather.empty:
                 mean_temp = filtered_weather['TT_10'].mean()
-                temp_html = f"""
-                    <div style="position: fixed; bottom: 20px; right: 20px; z-index: 1000; background-color: white; 
-                    padding: 10px; border-radius: 5px; box-shadow: 0 0 10px rgba(0,0,0,0.2);">
-                        <b>Mean Temperature: {mean_temp:.1f}°C</b>
-                    </div>
-                """
-                m.get_root().html.add_child(folium.Element(temp_html))
+        
+        if lightweight:
+            return build_map_payload(filtered_data, data_type, mean_temp)
+        return render_heatmap(filtered_data, data_type, mean_temp)
+    except Exception as e:
+        logging.error(f"Error creating heatmap: {str(e)}")
+        st.error(f"Error creating heatmap: {str(e)}")
+        return empty_map(lightweight)
+
+def create_range_heatmap(index, data_type, start_date, end_date, lightweight=False, exposure=None):
+    """Create a heatmap of station aggregates between two months using the prefix-sum index"""
+    try:
+        logging.info(f"Creating heatmap for {data_type} from {start_date} to {end_date}")
+        
+        # Patients are summed over the range, noise levels are averaged
+        if data_type == 'Noise Exposure':
+            filtered_data = exposure.aggregate(start_date, end_date)
+        else:
+            filtered_data = index.aggregate(start_date, end_date)
+        value_column = 'patient_count' if data_type == 'Patients Number' else 'db_a'
+        filtered_data = filtered_data.dropna(subset=[value_column])
+        
+        if filtered_data.empty:
+            st.warning(f"No data available from {start_date.strftime('%B %Y')} to {end_date.strftime('%B %Y')}")
+            return empty_map(lightweight)
+        
+        mean_temp = index.mean_temperature(start_date, end_date)
+        mean_temp = None if np.isnan(mean_temp) else mean_temp
+        if lightweight:
+            return build_map_payload(filtered_data, data_type, mean_temp)
+        return render_heatmap(filtered_data, data_type, mean_temp)
+    except Exception as e:
+        logging.error(f"Error creating heatmap: {str(e)}")
+        st.error(f"Error creating heatmap: {str(e)}")
+        return empty_map(lightweight)
+
+def station_layer(filtered_data, data_type):
+    """Station markers and heatmap points shared by the folium and lightweight maps.
+
+    Returns None (after a warning) when no station in the data has coordinates.
+    """
+    filtered_data = filtered_data.dropna(subset=['latitude', 'longitude'])
+    if filtered_data.empty:
+        st.warning("No valid location data available for the selected period.")
+        return None
+    
+    if data_type == 'Patients Number':
+        column, unit = 'patient_count', 'patients'
+    else:  # Aircraft Noise or Noise Exposure
+        column, unit = 'db_a', 'dB'
+    
+    # Collect anomaly flags per station for the selected period
+    flag_reasons = {}
+    if 'flagged' in filtered_data:
+        flagged_rows = filtered_data[filtered_data['flagged']]
+        for station, reasons in flagged_rows.groupby('station_name')['flag']:
+            flag_reasons[station] = ', '.join(sorted(set(', '.join(reasons).split(', '))))
+    
+    # One marker per station, highlighted in orange if it has flagged points
+    markers = []
+    for row in filtered_data.drop_duplicates('station_name').itertuples():
+        popup = f"{row.station_name} - {data_type} - Value: {getattr(row, column):.1f}{unit}"
+        if row.station_name in flag_reasons:
+            popup += f" - Flagged: {flag_reasons[row.station_name]}"
+        markers.append({
+            'lat': row.latitude,
+            'lon': row.longitude,
+            'popup': popup,
+            'color': 'orange' if row.station_name in flag_reasons else 'red',
+            'fill_opacity': 0.8,
+        })
+    
+    # Normalize the values for better visualization
+    values = filtered_data[column]
+    min_val, max_val = values.min(), values.max()
+    weights = (values - min_val) / (max_val - min_val) if max_val != min_val else pd.Series(0.5, index=values.index)
+    heat_points = [[lat, lon, round(float(w), 4)] for lat, lon, w in
+                   zip(filtered_data['latitude'], filtered_data['longitude'], weights)]
+    
+    return {
+        'name': data_type,
+        'heat': {'points': heat_points, 'options': {'radius': 25, 'blur': 15, 'minOpacity': 0.5, 'maxZoom': 18}},
+        'markers': markers,
+    }
+
+def build_map_payload(filtered_data, data_type, mean_temp=None):
+    """Same markers and heatmap as render_heatmap, as data for the lightweight renderer"""
+    layer = station_layer(filtered_data, data_type)
+    return map_payload([layer] if layer is not None else [], temperature=mean_temp)
+
+def render_heatmap(filtered_data, data_type, mean_temp=None):
+    """Draw station markers, heatmap and temperature box for already filtered data"""
+    try:
+        # Create a map centered at Mainz
+        m = folium.Map(location=[49.9929, 8.2473], zoom_start=11)
+        
+        layer = station_layer(filtered_data, data_type)
+        if layer is None:
+            return m
+        
+        # Display mean temperature if available
+        if mean_temp is not None:
+            temp_html = f"""
+                <div style="position: fixed; bottom: 20px; right: 20px; z-index: 1000; background-color: white; 
+                padding: 10px; border-radius: 5px; box-shadow: 0 0 10px rgba(0,0,0,0.2);">
+                    <b>Mean Temperature: {mean_temp:.1f}°C</b>
+                </div>
+            """
+            m.get_root().html.add_child(folium.Element(temp_html))
         
         # Add markers for each station
-        for idx, row in filtered_data.drop_duplicates('station_name').iterrows():
-            if data_type == 'Patients Number':
-                value = row['patient_count']
-                unit = 'patients'
-            else:  # Aircraft Noise
-                value = row['db_a']
-                unit = 'dB'
-            
+        for marker in layer['markers']:
+            icon = 'warning-sign' if marker['color'] == 'orange' else 'info-sign'
             folium.Marker(
-                location=[row['latitude'], row['longitude']],
-                popup=f"{row['station_name']} - {data_type} - Value: {value:.1f}{unit}",
-                icon=folium.Icon(color='red', icon='info-sign')
+                location=[marker['lat'], marker['lon']],
+                popup=marker['popup'],
+                icon=folium.Icon(color=marker['color'], icon=icon)
             ).add_to(m)
         
-        # Prepare data for heatmap with weights
-        heat_data = []
-        for _, row in filtered_data.iterrows():
-            if data_type == 'Patients Number':
-                value = row['patient_count']
-            else:  # Aircraft Noise
-                value = row['db_a']
-            
-            # Normalize the value for better visualization
-            min_val = filtered_data['patient_count'].min() if data_type == 'Patients Number' else filtered_data['db_a'].min()
-            max_val = filtered_data['patient_count'].max() if data_type == 'Patients Number' else filtered_data['db_a'].max()
-            normalized_value = (value - min_val) / (max_val - min_val) if max_val != min_val else 0.5
-            
-            heat_data.append([row['latitude'], row['longitude'], normalized_value])
-        
         # Add heatmap layer
-        plugins.HeatMap(heat_data).add_to(m)
+        plugins.HeatMap(layer['heat']['points'], **folium_heat_options(layer['heat']['options'])).add_to(m)
         
         return m
     except Exception as e:
@@ -230,29 +223,68 @@ def main():
         
         # Sidebar for options
         st.sidebar.header('Options')
-        data_type = st.sidebar.selectbox('Select Data Type', ['Aircraft Noise', 'Patients Number'])
-        frequency = st.sidebar.selectbox('Select Frequency', ['Annual', 'Monthly'])
+        data_type = st.sidebar.selectbox('Select Data Type', ['Aircraft Noise', 'Noise Exposure', 'Patients Number'])
+        frequency = st.sidebar.selectbox('Select Frequency', ['Annual', 'Monthly', 'Date Range', 'Trailing Window'])
+        exclude_flagged_points = st.sidebar.checkbox('Exclude flagged points', value=False,
+                                                     help='Drop outliers, flat and implausible readings before aggregating')
+        lightweight = st.sidebar.checkbox('Lightweight map', value=False,
+                                          help='Load map libraries once from the self-hosted asset server')
+        flags = load_flags()
+        index = load_index(exclude_flagged_points)
+        exposure = load_exposure(exclude_flagged_points)
+        years = index.years()
+        
+        # Filter data based on selection
+        if data_type == 'Aircraft Noise':
+            data, metric = noise_data, 'db_a'
+        elif data_type == 'Noise Exposure':
+            # Flagged station readings are already left out when the model is built
+            data, metric = exposure.frame(), 'db_a'
+        else:  # Patients
+            data, metric = patients, 'patient_count'
+        if data_type != 'Noise Exposure':
+            if exclude_flagged_points:
+                data = exclude_flagged(data, flags, metric)
+            data = mark_flags(data, flags, metric)
         
         # Date selection based on frequency
         if frequency == 'Monthly':
-            year = st.sidebar.selectbox('Select Year', range(2012, 2025))
-            month = st.sidebar.selectbox('Select Month', range(1, 13))
+            year = st.sidebar.selectbox('Select Year', years)
+            month = st.sidebar.selectbox('Select Month', index.months_for_year(year))
             selected_date = datetime(year, month, 1)
-        else:  # Annual
-            year = st.sidebar.selectbox('Select Year', range(2012, 2025))
+            heatmap = create_heatmap(data, data_type, frequency, selected_date, weather, lightweight)
+        elif frequency == 'Annual':
+            year = st.sidebar.selectbox('Select Year', years)
             selected_date = datetime(year, 1, 1)
+            heatmap = create_heatmap(data, data_type, frequency, selected_date, weather, lightweight)
+        elif frequency == 'Date Range':
+            start_date, end_date = st.sidebar.select_slider(
+                'Select Date Range',
+                options=list(index.months),
+                value=(index.months[0], index.months[-1]),
+                format_func=lambda d: d.strftime('%b %Y')
+            )
+            heatmap = create_range_heatmap(index, data_type, start_date, end_date, lightweight, exposure)
+        else:  # Trailing Window
+            window = st.sidebar.selectbox('Window (months)', [3, 6, 12])
+            end_date = st.sidebar.select_slider(
+                'Window End',
+                options=list(index.months),
+                value=index.months[-1],
+                format_func=lambda d: d.strftime('%b %Y')
+            )
+            start_date = end_date - pd.DateOffset(months=window - 1)
+            heatmap = create_range_heatmap(index, data_type, start_date, end_date, lightweight, exposure)
         
-        # Filter data based on selection
-        if data_type == 'Aircraft Noise':
-            data = noise_data
-        else:  # Patients
-            data = patients
-        
-        # Create heatmap
-        heatmap = create_heatmap(data, data_type, frequency, selected_date, weather)
+        # Display the map and report how much HTML this render sent
+        payload_bytes = show_map(heatmap)
+        st.caption(f"Map payload: {payload_bytes / 1024:.1f} KB")
         
-        # Display the map
-        folium_static(heatmap)
+        # List flagged points for the selected data type
+        metric_flags = flags[flags['metric'] == metric]
+        if not metric_flags.empty:
+            with st.expander(f"Flagged points ({len(metric_flags)})"):
+                st.dataframe(metric_flags[['period', 'station_name', 'value', 'flag', 'score']])
         
     except Exception as e:
         logging.error(f"Error in main function: {str(e)}")
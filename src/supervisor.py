@@ -0,0 +1,391 @@
+"""Supervisor for running several Streamlit workers behind a sticky-session proxy.
+
+A single Streamlit process serves all sessions from one Python interpreter, so it
+cannot use more than one core. The supervisor:
+
+- starts N `streamlit run streamlit_app.py` workers on consecutive local ports,
+- polls each worker's `/_stcore/health` endpoint instead of sleeping,
+- pre-warms each worker's data cache by running the app script once over the
+  Streamlit websocket before the worker receives traffic,
+- proxies browser traffic (HTTP and websockets) to ready workers, pinning each
+  browser to one worker with a cookie,
+- runs the data API next to the workers and proxies `/mainz-assets/...` to its
+  `/static/...`, so the lightweight map loads its assets from the app's own origin,
+- restarts crashed workers and shuts everything down on SIGINT/SIGTERM.
+
+Usage:
+    python src/supervisor.py --workers 4 --port 8501
+"""
+import argparse
+import asyncio
+import logging
+import os
+import secrets
+import signal
+import sys
+import time
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_app.py')
+API_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data_api.py')
+WORKER_HOST = '127.0.0.1'
+COOKIE_NAME = 'mainz_worker'
+HEALTH_PATH = '/_stcore/health'
+STREAM_PATH = '/_stcore/stream'
+# Streamlit serves its own frontend under /static, so map assets get their own prefix
+ASSET_PREFIX = b'/mainz-assets/'
+API_HEALTH_PATH = '/periods'
+MAX_HEADER_BYTES = 64 * 1024
+
+async def http_get(host, port, path, timeout=2.0):
+    """Plain HTTP GET returning (status, body), used for health checks"""
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        request = f'GET {path} HTTP/1.1\r\nHost: {host}:{port}\r\nConnection: close\r\n\r\n'
+        writer.write(request.encode('latin-1'))
+        await writer.drain()
+        data = await asyncio.wait_for(reader.read(), timeout)
+    finally:
+        writer.close()
+    status_line, _, rest = data.partition(b'\r\n')
+    _, _, body = rest.partition(b'\r\n\r\n')
+    return int(status_line.split(b' ')[1]), body
+
+async def prewarm(port, timeout):
+    """Run the app script once in a fresh session so `load_data` fills the worker's cache"""
+    # Streamlit ships tornado and its protobuf messages, so no extra dependency is needed
+    from tornado.websocket import websocket_connect
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+    url = f'ws://{WORKER_HOST}:{port}{STREAM_PATH}'
+    conn = await asyncio.wait_for(websocket_connect(url, subprotocols=['streamlit']), timeout)
+    try:
+        back_msg = BackMsg()
+        back_msg.rerun_script.query_string = ''
+        back_msg.rerun_script.page_script_hash = ''
+        await conn.write_message(back_msg.SerializeToString(), binary=True)
+
+        deadline = time.monotonic() + timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            message = await asyncio.wait_for(conn.read_message(), remaining)
+            if message is None:
+                raise ConnectionError('websocket closed before the script finished')
+            forward_msg = ForwardMsg()
+            forward_msg.ParseFromString(message)
+            if forward_msg.WhichOneof('type') == 'script_finished':
+                return
+    finally:
+        conn.close()
+
+class Worker:
+    """One Streamlit (or data API) process and its lifecycle state"""
+
+    def __init__(self, index, port, kind='streamlit'):
+        self.index = index
+        self.port = port
+        self.kind = kind
+        self.process = None
+        self.ready = False
+        self.started_at = 0.0
+        self.restarts = 0
+
+    def __repr__(self):
+        if self.kind == 'api':
+            return f'DataAPI(port={self.port})'
+        return f'Worker({self.index}, port={self.port})'
+
+class Supervisor:
+    def __init__(self, num_workers, proxy_host='127.0.0.1', proxy_port=8501, base_port=8510,
+                 app_path=APP_PATH, health_timeout=60.0, prewarm_timeout=120.0, api_port=8600):
+        self.workers = [Worker(i, base_port + i) for i in range(num_workers)]
+        self.api = Worker(None, api_port, kind='api')
+        self.proxy_host = proxy_host
+        self.proxy_port = proxy_port
+        self.app_path = app_path
+        self.health_timeout = health_timeout
+        self.prewarm_timeout = prewarm_timeout
+        # Shared so that XSRF cookies stay valid whichever worker issued them
+        self.cookie_secret = secrets.token_hex(32)
+        self.stopping = asyncio.Event()
+        self.any_ready = asyncio.Event()
+        self._next_worker = 0
+        self._tasks = []
+
+    # Worker lifecycle
+
+    async def start_worker(self, worker):
+        if worker.kind == 'api':
+            command = [sys.executable, API_PATH, '--host', WORKER_HOST, '--port', str(worker.port)]
+        else:
+            command = [
+                sys.executable, '-m', 'streamlit', 'run', self.app_path,
+                '--server.port', str(worker.port),
+                '--server.address', WORKER_HOST,
+                '--server.headless', 'true',
+                '--browser.gatherUsageStats', 'false',
+            ]
+        worker.ready = False
+        worker.started_at = time.monotonic()
+        worker.process = await asyncio.create_subprocess_exec(
+            *command,
+            cwd=os.path.dirname(self.app_path),
+            stdin=asyncio.subprocess.DEVNULL,
+            env={
+                **os.environ,
+                # Streamlit refuses sensitive options such as the cookie secret as CLI flags
+                'STREAMLIT_SERVER_COOKIE_SECRET': self.cookie_secret,
+                # Lets map_assets check that the assets behind ASSET_PREFIX are served
+                'MAINZ_ASSET_SERVER': f'http://{WORKER_HOST}:{self.api.port}',
+            },
+        )
+        logging.info(f"Started {worker} (pid {worker.process.pid})")
+
+    async def wait_healthy(self, worker):
+        """Poll the health endpoint until it answers 'ok', the process dies or we time out"""
+        deadline = time.monotonic() + self.health_timeout
+        delay = 0.1
+        while time.monotonic() < deadline and not self.stopping.is_set():
+            if worker.process.returncode is not None:
+                return False
+            try:
+                if worker.kind == 'api':
+                    status, _ = await http_get(WORKER_HOST, worker.port, API_HEALTH_PATH)
+                    if status == 200:
+                        return True
+                else:
+                    status, body = await http_get(WORKER_HOST, worker.port, HEALTH_PATH)
+                    if status == 200 and body.strip() == b'ok':
+                        return True
+            except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                pass
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+        return False
+
+    async def bring_up(self, worker):
+        await self.start_worker(worker)
+        if not await self.wait_healthy(worker):
+            logging.error(f"{worker} did not become healthy")
+            if worker.process.returncode is None:
+                worker.process.kill()
+            return
+        if worker.kind == 'api':
+            worker.ready = True
+            logging.info(f"{worker} is ready")
+            return
+        try:
+            started = time.monotonic()
+            await prewarm(worker.port, self.prewarm_timeout)
+            logging.info(f"Pre-warmed {worker} in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            # A cold cache is slower, not broken, so the worker still takes traffic
+            logging.warning(f"Could not pre-warm {worker}: {str(e)}")
+        worker.ready = True
+        self.any_ready.set()
+        logging.info(f"{worker} is ready")
+
+    async def supervise(self, worker):
+        """Keep one worker running, restarting it with backoff when it exits"""
+        backoff = 1.0
+        while not self.stopping.is_set():
+            await self.bring_up(worker)
+            returncode = await worker.process.wait()
+            worker.ready = False
+            if self.stopping.is_set():
+                return
+            # Reset the backoff if the worker ran for a while before crashing
+            if time.monotonic() - worker.started_at > 60:
+                backoff = 1.0
+            worker.restarts += 1
+            logging.warning(f"{worker} exited with code {returncode}, restarting in {backoff:.0f}s")
+            try:
+                await asyncio.wait_for(self.stopping.wait(), backoff)
+                return
+            except asyncio.TimeoutError:
+                pass
+            backoff = min(backoff * 2, 30.0)
+
+    async def stop_workers(self, grace=10.0):
+        running = [w for w in self.workers + [self.api] if w.process is not None and w.process.returncode is None]
+        for worker in running:
+            worker.ready = False
+            worker.process.terminate()
+        for worker in running:
+            try:
+                await asyncio.wait_for(worker.process.wait(), grace)
+            except asyncio.TimeoutError:
+                logging.warning(f"{worker} did not stop in time, killing it")
+                worker.process.kill()
+                await worker.process.wait()
+
+    # Sticky-session proxy
+
+    def pick_worker(self, cookie_header):
+        """Return (worker, needs_cookie) for a request, honoring the sticky cookie"""
+        for part in cookie_header.split(';'):
+            name, _, value = part.strip().partition('=')
+            if name == COOKIE_NAME and value.isdigit():
+                index = int(value)
+                if index < len(self.workers) and self.workers[index].ready:
+                    return self.workers[index], False
+        ready = [w for w in self.workers if w.ready]
+        if not ready:
+            return None, False
+        worker = ready[self._next_worker % len(ready)]
+        self._next_worker += 1
+        return worker, True
+
+    async def handle_client(self, client_reader, client_writer):
+        upstream_writer = None
+        try:
+            try:
+                head = await client_reader.readuntil(b'\r\n\r\n')
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            request_line, *header_lines = head[:-4].split(b'\r\n')
+            cookie_header = ''
+            upgrade = False
+            for line in header_lines:
+                name, _, value = line.partition(b':')
+                name = name.strip().lower()
+                if name == b'cookie':
+                    cookie_header = value.decode('latin-1')
+                elif name == b'upgrade':
+                    upgrade = True
+
+            # Connections are routed once, on their first request, so plain HTTP requests
+            # are sent with 'Connection: close'. A reused connection could otherwise carry
+            # an app request to the data API or an asset request to a worker.
+            if not upgrade:
+                header_lines = [line for line in header_lines
+                                if line.partition(b':')[0].strip().lower() not in (b'connection', b'keep-alive')]
+                header_lines.append(b'Connection: close')
+
+            method, _, rest = request_line.partition(b' ')
+            if rest.startswith(ASSET_PREFIX):
+                # Map assets come from the data API and need no sticky session
+                worker, needs_cookie = (self.api if self.api.ready else None), False
+                request_line = method + b' /static/' + rest[len(ASSET_PREFIX):]
+            else:
+                worker, needs_cookie = self.pick_worker(cookie_header)
+            head = b'\r\n'.join([request_line, *header_lines]) + b'\r\n\r\n'
+
+            if worker is None:
+                client_writer.write(
+                    b'HTTP/1.1 503 Service Unavailable\r\nContent-Length: 0\r\n'
+                    b'Retry-After: 5\r\nConnection: close\r\n\r\n'
+                )
+                await client_writer.drain()
+                return
+
+            upstream_reader, upstream_writer = await asyncio.open_connection(WORKER_HOST, worker.port)
+            upstream_writer.write(head)
+            await upstream_writer.drain()
+
+            if needs_cookie:
+                # Pin the browser to this worker on the first response of the connection
+                try:
+                    response_head = await upstream_reader.readuntil(b'\r\n\r\n')
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                    return
+                cookie = f'Set-Cookie: {COOKIE_NAME}={worker.index}; Path=/; HttpOnly; SameSite=Lax\r\n'
+                client_writer.write(response_head[:-2] + cookie.encode('latin-1') + b'\r\n')
+
+            # The connection is done once the worker has finished sending
+            to_upstream = asyncio.create_task(self._pipe(client_reader, upstream_writer))
+            try:
+                await self._pipe(upstream_reader, client_writer)
+            finally:
+                to_upstream.cancel()
+        except (ConnectionError, OSError) as e:
+            logging.debug(f"Proxy connection error: {str(e)}")
+        finally:
+            if upstream_writer is not None:
+                upstream_writer.close()
+            client_writer.close()
+
+    async def _pipe(self, reader, writer):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                writer.write(data)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            if writer.can_write_eof():
+                try:
+                    writer.write_eof()
+                except (ConnectionError, OSError):
+                    pass
+
+    # Entry point
+
+    async def run(self, on_ready=None):
+        """Run until SIGINT/SIGTERM. `on_ready` is called once the first worker is ready."""
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stopping.set)
+            except (NotImplementedError, RuntimeError):
+                # Windows event loops don't support signal handlers; Ctrl+C still
+                # raises KeyboardInterrupt in the caller
+                pass
+
+        self._tasks = [asyncio.create_task(self.supervise(w)) for w in self.workers + [self.api]]
+        server = await asyncio.start_server(
+            self.handle_client, self.proxy_host, self.proxy_port, limit=MAX_HEADER_BYTES
+        )
+        logging.info(f"Proxy listening on http://{self.proxy_host}:{self.proxy_port} "
+                     f"for {len(self.workers)} workers")
+        try:
+            ready_task = asyncio.create_task(self.any_ready.wait())
+            stop_task = asyncio.create_task(self.stopping.wait())
+            await asyncio.wait([ready_task, stop_task], return_when=asyncio.FIRST_COMPLETED)
+            ready_task.cancel()
+            if self.any_ready.is_set() and on_ready is not None:
+                on_ready()
+            await stop_task
+        finally:
+            logging.info("Shutting down...")
+            self.stopping.set()
+            server.close()
+            await server.wait_closed()
+            await self.stop_workers()
+            for task in self._tasks:
+                task.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            logging.info("All workers stopped")
+
+def add_arguments(parser):
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Number of Streamlit worker processes (default: CPU count)')
+    parser.add_argument('--port', type=int, default=8501, help='Port the proxy listens on')
+    parser.add_argument('--base-port', type=int, default=8510,
+                        help='First worker port; workers use consecutive ports')
+    parser.add_argument('--api-port', type=int, default=8600,
+                        help='Local port of the data API that serves the map assets')
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several Streamlit workers behind a sticky proxy')
+    parser.add_argument('--host', default='127.0.0.1', help='Address the proxy binds to')
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    supervisor = Supervisor(args.workers, args.host, args.port, args.base_port, api_port=args.api_port)
+    try:
+        asyncio.run(supervisor.run())
+    except KeyboardInterrupt:
+        pass
+    print("\nServer stopped.")
+
+if __name__ == '__main__':
+    main()
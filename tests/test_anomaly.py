@@ -0,0 +1,24 @@
+import pandas as pd
+
+from anomaly import detect_anomalies
+
+def monthly_series():
+    dates = pd.date_range('2018-01-01', periods=24, freq='MS')
+    values = [60.0 + (i % 3) * 0.5 for i in range(24)]
+    values[12] = 90.0
+    noise_data = pd.DataFrame({'station_name': 'Finthen', 'date': dates, 'db_a': values})
+    patients = pd.DataFrame({'station_name': 'Finthen', 'date': dates, 'patient_count': 3})
+    return patients, noise_data
+
+def test_flags_survive_an_unwritable_state_path(tmp_path, caplog):
+    patients, noise_data = monthly_series()
+    expected = detect_anomalies(patients, noise_data, str(tmp_path / 'fresh' / 'state.json'))
+    assert not expected.empty
+
+    # A directory in place of the state file makes both loading and saving fail
+    state_path = tmp_path / 'cache' / 'state.json'
+    state_path.mkdir(parents=True)
+    flags = detect_anomalies(patients, noise_data, str(state_path))
+    pd.testing.assert_frame_equal(flags, expected)
+    assert 'Could not save anomaly state' in caplog.text
+    assert [path.name for path in state_path.parent.iterdir()] == ['state.json']
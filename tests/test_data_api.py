@@ -0,0 +1,168 @@
+import asyncio
+import gzip
+import json
+import socket
+import threading
+
+import pandas as pd
+import pytest
+
+from data_api import DataStore, start_server
+from data_loader import station_coords
+
+STATIONS = ['Hechtsheim', 'Finthen']
+MONTHS = pd.to_datetime(['2018-09-01', '2018-10-01', '2018-11-01'])
+
+def small_dataset():
+    """Three months and two stations, in the layout read_data returns"""
+    weather = pd.DataFrame({
+        'month_year': MONTHS.strftime('%B %Y'),
+        'TT_10': [15.0, 10.5, 5.2],
+        'date': MONTHS,
+    })
+    rows = [(date, name) for date in MONTHS for name in STATIONS]
+    patients = pd.DataFrame({
+        'month_year': [date.strftime('%B %Y') for date, _ in rows],
+        'closest_station': [f"Mainz/{name}" for _, name in rows],
+        'patient_count': [4, 2, 5, 3, 6, 1],
+        'date': [date for date, _ in rows],
+        'station_name': [name for _, name in rows],
+        'latitude': [station_coords[name][0] for _, name in rows],
+        'longitude': [station_coords[name][1] for _, name in rows],
+    })
+    noise_data = pd.DataFrame({
+        'month_year': [date.strftime('%B %Y') for date, _ in rows],
+        'date': [date for date, _ in rows],
+        'station_name': [name for _, name in rows],
+        'latitude': [station_coords[name][0] for _, name in rows],
+        'longitude': [station_coords[name][1] for _, name in rows],
+        'db_a': [67.1, 58.3, 67.4, 58.9, 66.8, 57.5],
+    })
+    return weather, patients, noise_data
+
+@pytest.fixture(scope='module')
+def port():
+    store = DataStore(*small_dataset())
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(start_server('127.0.0.1', 0, store))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server.sockets[0].getsockname()[1]
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=5)
+
+def read_response(stream, method='GET'):
+    """Read one response from a socket file; returns (status, headers, body)"""
+    status_line = stream.readline()
+    if not status_line:
+        return None
+    status = int(status_line.split()[1])
+    headers = {}
+    while True:
+        line = stream.readline().decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    length = 0 if method == 'HEAD' or status == 304 else int(headers['content-length'])
+    return status, headers, stream.read(length)
+
+def request(port, raw, count=1, method='GET'):
+    """Send raw request bytes and read `count` responses"""
+    with socket.create_connection(('127.0.0.1', port), timeout=5) as sock:
+        sock.sendall(raw)
+        stream = sock.makefile('rb')
+        responses = [read_response(stream, method) for _ in range(count)]
+        # Anything after the expected responses means the server wrote too much
+        sock.settimeout(0.2)
+        try:
+            extra = stream.read1(1)
+        except socket.timeout:
+            extra = b''
+    return responses if count > 1 else responses[0], extra
+
+def get(port, target, headers='', method='GET'):
+    raw = f"{method} {target} HTTP/1.1\r\nHost: test\r\n{headers}Connection: close\r\n\r\n"
+    response, extra = request(port, raw.encode('latin-1'), method=method)
+    assert extra == b''
+    return response
+
+def test_identity_and_gzip_variants(port):
+    status, headers, body = get(port, '/period/2018-10')
+    assert status == 200
+    assert 'content-encoding' not in headers
+    assert headers['vary'] == 'Accept-Encoding'
+    payload = json.loads(body)
+    assert {feature['properties']['station_name'] for feature in payload['features']} >= set(STATIONS)
+
+    gz_status, gz_headers, gz_body = get(port, '/period/2018-10', 'Accept-Encoding: gzip\r\n')
+    assert gz_status == 200
+    assert gz_headers['content-encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(gz_body)) == payload
+    assert gz_headers['etag'] != headers['etag']
+
+def test_if_none_match_only_for_matching_variant(port):
+    _, headers, _ = get(port, '/periods')
+    _, gz_headers, _ = get(port, '/periods', 'Accept-Encoding: gzip\r\n')
+
+    status, _, body = get(port, '/periods', f"If-None-Match: {headers['etag']}\r\n")
+    assert (status, body) == (304, b'')
+    status, _, _ = get(port, '/periods', f"If-None-Match: W/{gz_headers['etag']}\r\nAccept-Encoding: gzip\r\n")
+    assert status == 304
+    # The identity ETag does not validate the gzip variant and vice versa
+    status, _, _ = get(port, '/periods', f"If-None-Match: {headers['etag']}\r\nAccept-Encoding: gzip\r\n")
+    assert status == 200
+    status, _, _ = get(port, '/periods', f"If-None-Match: {gz_headers['etag']}\r\n")
+    assert status == 200
+
+def test_head_has_no_body(port):
+    _, get_headers, _ = get(port, '/stations')
+    status, headers, body = get(port, '/stations', method='HEAD')
+    assert status == 200
+    assert body == b''
+    assert headers['content-length'] == get_headers['content-length']
+
+def test_pipelined_requests(port):
+    targets = ['/periods', '/period/2018-09', '/station/Finthen']
+    raw = ''.join(f"GET {target} HTTP/1.1\r\nHost: test\r\n\r\n" for target in targets)
+    raw += "GET /periods HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n"
+    responses, extra = request(port, raw.encode('latin-1'), count=4)
+    assert extra == b''
+    assert [status for status, _, _ in responses] == [200, 200, 200, 200]
+    assert json.loads(responses[0][2]) == {'periods': ['2018-09', '2018-10', '2018-11']}
+    assert json.loads(responses[1][2])['type'] == 'FeatureCollection'
+    assert json.loads(responses[2][2])['station_name'] == 'Finthen'
+
+def test_range(port):
+    status, _, body = get(port, '/range?start=2018-09&end=2018-10')
+    assert status == 200
+    assert json.loads(body)['type'] == 'FeatureCollection'
+    for target in ('/range?start=2018-10', '/range?start=2018-11&end=2018-09', '/range?start=x&end=2018-10'):
+        assert get(port, target)[0] == 400
+
+def test_not_found(port):
+    for target in ('/nope', '/period/2030-01', '/station/Atlantis', '/static/../data_api.py'):
+        assert get(port, target)[0] == 404
+
+def test_other_methods_are_refused_before_the_body(port):
+    # The body is never sent; the server has to answer and close on the headers alone
+    raw = b"POST /periods HTTP/1.1\r\nHost: test\r\nContent-Length: 1000000\r\n\r\n"
+    (status, headers, _), extra = request(port, raw)
+    assert status == 405
+    assert headers['connection'] == 'close'
+    assert extra == b''
+
+def test_request_bodies_are_rejected(port):
+    chunked = b"GET /periods HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nhello\r\n0\r\n\r\n"
+    with_length = b"GET /periods HTTP/1.1\r\nContent-Length: 5\r\n\r\nhello"
+    for raw in (chunked, with_length):
+        (status, headers, _), extra = request(port, raw)
+        assert status == 400
+        assert headers['connection'] == 'close'
+        assert extra == b''
+
+def test_oversized_headers(port):
+    raw = b"GET /periods HTTP/1.1\r\n" + b"X-Filler: aaaaaaaa\r\n" * 2000
+    (status, _, _), _ = request(port, raw)
+    assert status == 431
@@ -0,0 +1,41 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import read_data, station_breakdown
+from range_index import RangeIndex
+
+@pytest.fixture(scope='module')
+def data():
+    return read_data()
+
+@pytest.fixture(scope='module')
+def index(data):
+    return RangeIndex(*data)
+
+# Month offsets from the first and last month of the data, including ranges that
+# lie partly or wholly outside it
+RANGES = {
+    'all': (('first', 0), ('last', 0)),
+    'first month': (('first', 0), ('first', 0)),
+    'last six months': (('last', -5), ('last', 0)),
+    'starts before the data': (('first', -60), ('first', 2)),
+    'starts after the data': (('last', 1), ('last', 60)),
+    'far after the data': (('last', 60), ('last', 72)),
+    'ends before the data': (('first', -60), ('first', -1)),
+}
+
+@pytest.mark.parametrize('bounds', RANGES.values(), ids=RANGES.keys())
+def test_aggregate_matches_pandas(data, index, bounds):
+    weather, patients, noise_data = data
+    anchors = {'first': index.months[0], 'last': index.months[-1]}
+    start, end = (anchors[anchor] + pd.DateOffset(months=offset) for anchor, offset in bounds)
+
+    result = index.aggregate(start, end).set_index('station_name')
+    expected = station_breakdown(patients, noise_data, weather, start, end).set_index('station_name')
+    expected = expected.reindex(result.index)
+    assert np.allclose(result['db_a'], expected['db_a'], equal_nan=True)
+    assert (result['noise_months'] == expected['noise_months'].fillna(0)).all()
+    assert np.allclose(result['patient_count'].fillna(0), expected['patient_count'].fillna(0))
+    temperature = weather[(weather['date'] >= start) & (weather['date'] <= end)]['TT_10'].mean()
+    assert np.isclose(index.mean_temperature(start, end), temperature, equal_nan=True)